@@ -6,6 +6,10 @@ from fastapi.staticfiles import StaticFiles
 from starlette.responses import FileResponse, Response
 from .context import *
 from .routes.api import router as api_router
+from .download import job_queue, subscription_scheduler
+from .cache import metadata_cache
+from .library import library_index
+from .models.prefetch import prefetcher
 
 
 app = FastAPI()
@@ -14,6 +18,25 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 app.include_router(api_router)
 
 
+@app.on_event("startup")
+async def start_job_queue():
+    metadata_cache.load()
+    library_index.start_scan()
+    job_queue.start()
+    subscription_scheduler.start()
+    if get_prefetch_enabled():
+        prefetcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    prefetcher.stop()
+    subscription_scheduler.stop()
+    job_queue.stop()
+    library_index.stop()
+    metadata_cache.save()
+
+
 @app.get("/")
 async def read_index():
     return FileResponse('app/static/index.html')
@@ -0,0 +1,172 @@
+from .metrics import header, register_collector, sample
+from .context import (
+    get_data_dir,
+    get_metadata_cache_size,
+    get_metadata_cache_ttl,
+    get_metadata_cache_persist,
+)
+
+import time
+import pickle
+import logging
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+__all__ = ["TTLCache", "metadata_cache"]
+
+logger = logging.getLogger("master")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded cache whose entries expire after a fixed TTL.
+    The least recently used entry is evicted once the cache is full.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, path: Optional[Path] = None):
+        assert maxsize > 0, "maxsize should be positive"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[0] >= time.time()
+
+    def invalidate(self, key: Hashable):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_prefix(self, *prefix: Hashable):
+        """
+        Drops every entry whose key starts with prefix, such as all pages
+        cached for one artist.
+        """
+        with self.lock:
+            for key in [
+                key for key in self.entries
+                if isinstance(key, tuple) and key[:len(prefix)] == prefix
+            ]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def cached(self, namespace: str) -> Callable:
+        """
+        Decorator caching a lookup under (namespace, *args).
+        """
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            @wraps(func)
+            def wrapper(*args: Hashable):
+                value = self.get((namespace, *args), _MISSING)
+                if value is _MISSING:
+                    value = func(*args)
+                    self.set((namespace, *args), value)
+                return value
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with open(self.path, "rb") as file:
+                entries = pickle.load(file)
+            now = time.time()
+            with self.lock:
+                for key, (expires_at, value) in entries.items():
+                    if expires_at >= now:
+                        self.entries[key] = (expires_at, value)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            logger.info(f"Loaded {len(self.entries)} cache entries from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load cache from {self.path}: {e}")
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            with self.lock:
+                entries = OrderedDict(self.entries)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as file:
+                pickle.dump(entries, file)
+            tmp_path.replace(self.path)
+            logger.info(f"Saved {len(entries)} cache entries to {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to save cache to {self.path}: {e}")
+
+
+metadata_cache = TTLCache(
+    get_metadata_cache_size(),
+    get_metadata_cache_ttl(),
+    get_data_dir().joinpath("metadata_cache.pickle")
+    if get_metadata_cache_persist()
+    else None,
+)
+
+
+def collect_metrics() -> List[str]:
+    stats = metadata_cache.stats()
+    lines = []
+    for key in ("hits", "misses", "evictions"):
+        name = f"jmm_metadata_cache_{key}_total"
+        lines.extend(header(name, "counter", f"Metadata cache {key}."))
+        lines.append(sample(name, stats[key]))
+    lines.extend(header("jmm_metadata_cache_size", "gauge", "Entries in the metadata cache."))
+    lines.append(sample("jmm_metadata_cache_size", stats["size"]))
+    return lines
+
+
+register_collector(collect_metrics)
@@ -3,51 +3,79 @@ from spotdl.types.options import SpotifyOptions
 from spotdl.download.progress_handler import BAD_CHARS
 from dotenv import load_dotenv
 
+from .logs import (
+    JSONFormatter,
+    SamplingFilter,
+    level_for,
+    parse_levels,
+    start_listener,
+)
+
 import os
 import sys
 import logging
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
 
 
 load_dotenv()
 
 
 def initialize_logger():
+    """
+    Sets up the master logger and every logger registered so far. Levels
+    come from LOG_LEVEL and per logger from LOG_LEVELS. With LOG_ASYNC the
+    loggers only queue records and a listener thread does the writing.
+    """
     master_logger = logging.getLogger('master')
-    master_logger.setLevel(logging.DEBUG)
     logs_dir = get_logs_dir()
     logs_dir.mkdir(parents=True, exist_ok=True)
     log_file_path = logs_dir.joinpath(
         f'master-{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.log')
-    file_handler = logging.FileHandler(str(log_file_path))
+    file_handler = RotatingFileHandler(
+        str(log_file_path),
+        maxBytes=get_log_max_bytes(),
+        backupCount=get_log_backup_count(),
+    )
     file_handler.setLevel(logging.DEBUG)
 
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
 
-    simple_formatter = logging.Formatter(
-        '%(levelname)s: %(message)s'
-    )
+    if get_log_format() == "json":
+        simple_formatter = detailed_formatter = JSONFormatter()
+    else:
+        simple_formatter = logging.Formatter(
+            '%(levelname)s: %(message)s'
+        )
 
-    detailed_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - '
-        '%(filename)s:%(lineno)d - %(message)s'
-    )
+        detailed_formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - '
+            '%(filename)s:%(lineno)d - %(message)s'
+        )
 
     console_handler.setFormatter(simple_formatter)
     file_handler.setFormatter(detailed_formatter)
 
-    master_logger.addHandler(file_handler)
-    master_logger.addHandler(console_handler)
+    if get_log_async():
+        handlers = [start_listener(file_handler, console_handler)]
+    else:
+        handlers = [file_handler, console_handler]
+    for handler in handlers:
+        handler.addFilter(SamplingFilter(get_log_debug_per_second()))
 
-    master_logger.propagate = False
+    default_level = logging.getLevelName(get_log_level())
+    levels = parse_levels(get_log_levels())
+    for name in ['master', *levels]:
+        logging.getLogger(name)
 
     for logger_name, logger in logging.Logger.manager.loggerDict.items():
         if isinstance(logger, logging.Logger):
-            logger.setLevel(logging.DEBUG)
-            logger.addHandler(file_handler)
-            logger.addHandler(console_handler)
+            logger.setLevel(level_for(logger_name, levels, default_level))
+            for handler in handlers:
+                logger.addHandler(handler)
             logger.propagate = False
 
     master_logger.info("Logger initialized.")
@@ -56,26 +84,183 @@ def initialize_logger():
 
 
 def get_music_dir():
-    return Path(os.environ.get("MUSIC_DIR", "/music")).absolute()
+    return Path(os.getenv("MUSIC_DIR") or "/music").absolute()
 
 
 def get_playlists_dir():
-    return Path(os.environ.get("PLAYLISTS_DIR", "/playlists")).absolute()
+    return Path(os.getenv("PLAYLISTS_DIR") or "/playlists").absolute()
 
 
 def get_host_music_dir():
-    return Path(os.environ.get("HOST_MUSIC_DIR", "/music")).absolute()
+    return Path(os.getenv("HOST_MUSIC_DIR") or "/music").absolute()
 
 
 def get_logs_dir():
-    return Path(os.getenv("LOGS_DIR", "/logs")).absolute()
+    return Path(os.getenv("LOGS_DIR") or "/logs").absolute()
+
+
+def get_log_level():
+    return (os.getenv("LOG_LEVEL") or "DEBUG").upper()
+
+
+def get_log_levels():
+    return os.getenv("LOG_LEVELS", "")
+
+
+def get_log_format():
+    return (os.getenv("LOG_FORMAT") or "text").lower()
+
+
+def get_log_async():
+    return (os.getenv("LOG_ASYNC") or "true").lower() in ("1", "true", "yes")
+
+
+def get_log_max_bytes():
+    return max(0, int(os.getenv("LOG_MAX_BYTES") or str(10 * 1024 * 1024)))
+
+
+def get_log_backup_count():
+    return max(0, int(os.getenv("LOG_BACKUP_COUNT") or "5"))
+
+
+def get_log_debug_per_second():
+    return max(0, int(os.getenv("LOG_DEBUG_PER_SECOND") or "20"))
+
+
+def get_music_format():
+    return os.getenv("MUSIC_FORMAT") or "mp3"
+
+
+def get_data_dir():
+    return Path(os.getenv("DATA_DIR") or "/data").absolute()
+
+
+def get_library_format_policy():
+    policy = (os.getenv("LIBRARY_FORMAT_POLICY") or "any").lower()
+    assert policy in ("any", "exact"), "LIBRARY_FORMAT_POLICY should be any or exact"
+    return policy
+
+
+def get_library_scan_workers():
+    return max(1, int(os.getenv("LIBRARY_SCAN_WORKERS") or str(os.cpu_count() or 1)))
+
+
+def get_library_rescan_interval():
+    return max(0.0, float(os.getenv("LIBRARY_RESCAN_INTERVAL") or "3600"))
+
+
+def get_download_workers():
+    return max(1, int(os.getenv("DOWNLOAD_WORKERS") or "2"))
+
+
+def get_album_metadata_concurrency():
+    return max(1, int(os.getenv("ALBUM_METADATA_CONCURRENCY") or "1"))
+
+
+def get_album_download_concurrency():
+    return max(1, int(os.getenv("ALBUM_DOWNLOAD_CONCURRENCY") or "1"))
+
+
+def get_progress_stream_rate():
+    return max(0.1, float(os.getenv("PROGRESS_STREAM_RATE") or "2"))
+
+
+def get_progress_history_size():
+    return max(0, int(os.getenv("PROGRESS_HISTORY_SIZE") or "50"))
+
+
+def get_progress_history_ttl():
+    return float(os.getenv("PROGRESS_HISTORY_TTL") or "600")
+
+
+def get_subscription_interval():
+    return max(60.0, float(os.getenv("SUBSCRIPTION_INTERVAL") or "21600"))
+
+
+def get_subscription_jitter():
+    return min(1.0, max(0.0, float(os.getenv("SUBSCRIPTION_JITTER") or "0.1")))
+
+
+def get_subscription_checks_per_minute():
+    return max(0.1, float(os.getenv("SUBSCRIPTION_CHECKS_PER_MINUTE") or "10"))
+
+
+def get_spotify_requests_per_second():
+    return max(0.1, float(os.getenv("SPOTIFY_REQUESTS_PER_SECOND") or "5"))
+
+
+def get_spotify_burst():
+    return max(1, int(os.getenv("SPOTIFY_BURST") or "10"))
+
+
+def get_spotify_max_retries():
+    return max(0, int(os.getenv("SPOTIFY_MAX_RETRIES") or "5"))
+
+
+def get_http_pool_size():
+    return max(1, int(os.getenv("HTTP_POOL_SIZE") or "16"))
+
+
+def get_cover_art_concurrency():
+    return max(1, int(os.getenv("COVER_ART_CONCURRENCY") or "4"))
+
+
+def get_cover_art_max_age():
+    return float(os.getenv("COVER_ART_MAX_AGE") or "86400")
+
+
+def get_query_threads():
+    return max(1, int(os.getenv("QUERY_THREADS") or "8"))
+
+
+def get_query_timeout():
+    return float(os.getenv("QUERY_TIMEOUT") or "30")
+
+
+def get_prefetch_enabled():
+    return (os.getenv("PREFETCH_ENABLED") or "false").lower() in ("1", "true", "yes")
+
+
+def get_prefetch_limit():
+    return max(0, int(os.getenv("PREFETCH_LIMIT") or "8"))
+
+
+def get_prefetch_concurrency():
+    return max(1, int(os.getenv("PREFETCH_CONCURRENCY") or "2"))
+
+
+def get_prefetch_per_minute():
+    return max(1.0, float(os.getenv("PREFETCH_PER_MINUTE") or "30"))
+
+
+def get_metadata_cache_size():
+    return max(1, int(os.getenv("METADATA_CACHE_SIZE") or "512"))
+
+
+def get_metadata_cache_ttl():
+    return float(os.getenv("METADATA_CACHE_TTL") or "3600")
+
+
+def get_metadata_cache_persist():
+    return (os.getenv("METADATA_CACHE_PERSIST") or "false").lower() in ("1", "true", "yes")
+
+
+# Drops the characters spotdl strips from file names.
+CLEAN_TABLE = str.maketrans(dict.fromkeys(BAD_CHARS))
+
+
+@lru_cache(maxsize=8192)
+def _clean(s: str) -> str:
+    return s.translate(CLEAN_TABLE)
 
 
 def clean(s: str) -> str:
+    """
+    Removes characters that are not allowed in file names. Cached since the
+    same artist and album names are cleaned for every song.
+    """
     assert isinstance(s, str), "Input to clean must be a string"
-    logger.debug(f"Cleaning string: {s}")
-    cleaned = "".join(c for c in s if c not in [chr(i) for i in BAD_CHARS])
-    return cleaned
+    return _clean(s)
 
 
 logger = initialize_logger()
@@ -97,6 +282,7 @@ except Exception as e:
 
 __music_dir = get_music_dir()
 __playlist_dir = get_playlists_dir()
+__data_dir = get_data_dir()
 try:
     if not __music_dir.exists():
         logger.debug(
@@ -117,8 +303,18 @@ try:
         raise PermissionError(
             f"Cannot write to __playlist_dir: {__playlist_dir}")
 
+    if not __data_dir.exists():
+        logger.debug(
+            f"__data_dir does not exist. Creating directory: {__data_dir}")
+        __data_dir.mkdir(parents=True, exist_ok=True)
+
+    if not os.access(__data_dir, os.W_OK):
+        logger.error(f"Cannot write to __data_dir: {__data_dir}")
+        raise PermissionError(f"Cannot write to __data_dir: {__data_dir}")
+
     logger.debug(f"__music_dir is ready and writable: {__music_dir}")
 
 except Exception as e:
-    logger.critical(f"Failed to prepare music dir or playlist dir: {e}")
+    logger.critical(
+        f"Failed to prepare music dir, playlist dir or data dir: {e}")
     raise
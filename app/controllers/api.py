@@ -1,14 +1,38 @@
-from fastapi import HTTPException, BackgroundTasks, Request
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 
 from ..models.spotify_types import Playlist, Track, Artist, Album
-from ..download import download, validate_url, get_progress_trackers_state
+from ..models.metadata import ARTIST_ALBUMS_PAGE_SIZE, PLAYLIST_TRACKS_PAGE_SIZE
+from ..models.prefetch import prefetcher
+from ..library import (
+    PARTIAL,
+    PRESENT,
+    cover_art,
+    is_cover_url,
+    library_index,
+    summarize_status,
+)
+from ..download import (
+    validate_url,
+    get_progress_tracker_state,
+    job_queue,
+    progress_stream,
+    subscription_scheduler,
+    tracker_key as tracker_key_,
+)
+from ..context import get_query_threads, get_query_timeout
+from ..metrics import Histogram, render
 from fastapi.templating import Jinja2Templates as Jinja2Templates_
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from spotdl.types.song import Song
-from spotdl.types.artist import Artist as Artist_
 from datetime import datetime
+from urllib.parse import quote
 
+import re
+import uuid
+import asyncio
 import logging
 import threading
 
@@ -34,15 +58,140 @@ __all__ = ["controller"]
 
 logger = logging.getLogger("master")
 templates = Jinja2Templates(directory="app/templates")
+query_executor = ThreadPoolExecutor(
+    get_query_threads(), thread_name_prefix="query")
+query_duration = Histogram(
+    "jmm_query_duration_seconds", "Time to resolve a query page, by type.", ["type"])
 
 
-def get_metadata(url: str, type_: str):
+def library_status(songs: List[dict]) -> dict:
+    """
+    Whether each song is in the library, keyed by id, and the resulting
+    status of the whole list.
+    """
+    song_status = library_index.song_status(song["id"] for song in songs if song.get("id"))
     return {
-        "album": Album,
-        "artist": Artist,
-        "playlist": Playlist,
-        "track": Track,
-    }[type_].get_metadata(url)
+        "song_status": song_status,
+        "status": summarize_status(song_status.values()),
+        "missing_count": sum(status != PRESENT for status in song_status.values()),
+    }
+
+
+def playlist_tracks_context(
+    url: str, snapshot_id: str, page: int, items: List[dict], total: int
+) -> dict:
+    songs = [
+        {"added_at": item.get("added_at"), **item["track"]}
+        for item in items
+        if item.get("track") and item["track"].get("type") == "track"
+    ]
+    return {
+        "songs": songs,
+        "song_status": library_status(songs)["song_status"],
+        "playlist_url": url,
+        "snapshot_id": snapshot_id,
+        "offset": (page - 1) * PLAYLIST_TRACKS_PAGE_SIZE,
+        "next_page": page + 1 if page * PLAYLIST_TRACKS_PAGE_SIZE < total else None,
+    }
+
+
+def resolve_query(url: str, valid: str) -> Tuple[str, dict]:
+    """
+    Blocking part of a query, run on the query thread pool. Artists and
+    playlists only fetch what the first paint needs, the rest of the view
+    is loaded page by page.
+    """
+    match valid:
+        case "album":
+            album, _ = Album.get_metadata(url)
+        case "track":
+            _, song = Track.get_metadata(url)
+            album, _ = Album.get_metadata(
+                f"https://open.spotify.com/album/{song.album_id}")
+        case "artist":
+            return "artist", {"artist": Artist.get_summary(url)}
+        case "playlist":
+            playlist = Playlist.get_summary(url)
+            return "playlist", {
+                "playlist": playlist,
+                **playlist_tracks_context(
+                    playlist["url"],
+                    playlist["snapshot_id"],
+                    1,
+                    playlist["tracks"]["items"],
+                    playlist["tracks"]["total"],
+                ),
+            }
+    songs = album["tracks"]["items"]
+    return "album", {"album": album, "songs": songs, **library_status(songs)}
+
+
+def owned_albums(albums: List[dict]) -> Dict[str, str]:
+    """
+    PRESENT or PARTIAL for the albums with songs in the library, keyed by
+    album id.
+    """
+    owned = {}
+    for album_id, count in library_index.album_song_counts(albums).items():
+        if count:
+            total = next(a.get("total_tracks") for a in albums if a["id"] == album_id)
+            owned[album_id] = PRESENT if total and count >= total else PARTIAL
+    return owned
+
+
+def resolve_albums_page(url: str, page: int) -> dict:
+    albums, total = Artist.get_albums_page(url, page)
+    context = {
+        "albums": albums,
+        "owned": owned_albums(albums),
+        "artist_url": url,
+        "next_page": page + 1 if page * ARTIST_ALBUMS_PAGE_SIZE < total else None,
+    }
+    if page == 1:
+        context["album_count"] = total
+    return context
+
+
+def resolve_tracks_page(url: str, snapshot_id: str, page: int) -> dict:
+    items, total = Playlist.get_tracks_page(url, snapshot_id, page)
+    return playlist_tracks_context(url, snapshot_id, page, items, total)
+
+
+def linked_entities(context: dict) -> List[Tuple[str, str]]:
+    """
+    The albums and artists a rendered view links to, in display order.
+    """
+    links = []
+    if "album" in context:
+        links += [("artist", artist["id"]) for artist in context["album"]["artists"]]
+    for album in context.get("albums", []):
+        links.append(("album", album["id"]))
+    for song in context.get("songs", []):
+        if song.get("album"):
+            links.append(("album", song["album"]["id"]))
+        links += [("artist", artist["id"]) for artist in song.get("artists", [])]
+    return [
+        (type_, f"https://open.spotify.com/{type_}/{id_}")
+        for type_, id_ in links if id_
+    ]
+
+
+async def run_query(type_: str, func, *args):
+    """
+    Runs a blocking lookup on the query thread pool, giving up after
+    QUERY_TIMEOUT seconds.
+    """
+    try:
+        with query_duration.time(type=type_):
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(query_executor, func, *args),
+                timeout=get_query_timeout(),
+            )
+    except asyncio.TimeoutError:
+        # The lookup keeps running in its thread and lands in the
+        # metadata cache, so a retry is usually fast.
+        logger.error(f"Query timed out: {args[0]}")
+        raise HTTPException(status_code=504, detail="SPOTIFY_TIMEOUT")
 
 
 def jinja_env(func):
@@ -95,70 +244,246 @@ def songs_by_album(songs: List[Song]):
     return result
 
 
+@jinja_env
+def tracker_key(tracker_id: str):
+    return tracker_key_(tracker_id)
+
+
+@jinja_env
+def cover(url: Optional[str]):
+    """
+    Serves Spotify images through the local cover art store.
+    """
+    if not is_cover_url(url):
+        return url or ""
+    return f"/covers/?url={quote(url, safe='')}"
+
+
 @jinja_env
 def format_day_and_month(value):
     dt = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
     return dt.strftime('%b %d')
 
 
+async def read_bulk_urls(request: Request) -> List[str]:
+    """
+    Reads the urls of a bulk download from a JSON list (or {"urls": [...]}),
+    a form with a `urls` field and/or an uploaded `file`, or a plain text body.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        body = await request.json()
+        urls = body.get("urls", []) if isinstance(body, dict) else body
+        if not isinstance(urls, list):
+            raise HTTPException(status_code=400, detail="INVALID_URL_LIST")
+        return [str(url) for url in urls]
+
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        form = await request.form()
+        text = str(form.get("urls") or "")
+        upload = form.get("file")
+        if upload is not None and hasattr(upload, "read"):
+            text += "\n" + (await upload.read()).decode("utf-8", "ignore")
+    else:
+        text = (await request.body()).decode("utf-8", "ignore")
+    return [url for url in re.split(r"[\s,]+", text) if url]
+
+
 class APIController:
     @staticmethod
     async def query(url: str, request: Request):
         url, valid = validate_url(url)
         if not valid:
             raise HTTPException(status_code=400, detail=url)
-        metadata = list(get_metadata(url, valid))
-
-        match valid:
-            case "album":
-                metadata[1] = metadata[0]["tracks"]["items"]
-            case "playlist":
-                metadata[1] = [
-                    {
-                        "added_at": song.get("added_at"),
-                        **song.get("track", {})
-                    }
-                    for song in metadata[0]["tracks"]["items"]
-                ]
-            case "artist":
-                metadata = [metadata[0], Artist_.from_url(url).songs]
-            case "track":
-                metadata = list(get_metadata(
-                    f"https://open.spotify.com/album/{metadata[1].album_id}", (valid := "album")))
-                metadata[1] = metadata[0]["tracks"]["items"]
+        valid, context = await run_query(valid, resolve_query, url, valid)
+        prefetcher.submit(linked_entities(context))
         return templates.TemplateResponse(
-            f"components/{valid}_info.jinja", {"request": request,
-                                               valid: metadata[0], "songs": metadata[1]}
+            f"components/{valid}_info.jinja", {"request": request, **context}
+        )
+
+    @staticmethod
+    async def query_albums(artist: str, page: int, request: Request):
+        url, valid = validate_url(artist)
+        if valid != "artist":
+            raise HTTPException(status_code=400, detail=url)
+        context = await run_query("artist_albums", resolve_albums_page, url, page)
+        prefetcher.submit(linked_entities(context))
+        return templates.TemplateResponse(
+            "components/albums_container.jinja", {"request": request, **context}
+        )
+
+    @staticmethod
+    async def query_tracks(playlist: str, snapshot_id: str, page: int, request: Request):
+        url, valid = validate_url(playlist)
+        if valid != "playlist":
+            raise HTTPException(status_code=400, detail=url)
+        context = await run_query("playlist_tracks", resolve_tracks_page, url, snapshot_id, page)
+        prefetcher.submit(linked_entities(context))
+        return templates.TemplateResponse(
+            "components/playlist_tracks.jinja", {"request": request, **context}
         )
 
     @classmethod
-    async def download(cls, url: str, request: Request, background_tasks: BackgroundTasks):
+    async def download(cls, url: str, request: Request, priority: int = 0):
         url, valid = validate_url(url)
         if not valid:
             raise HTTPException(status_code=400, detail=url)
-        background_tasks.add_task(download, url, valid)
+        job_queue.enqueue(url, valid, priority)
         return await cls.progress(url=url, request=request)
 
+    @classmethod
+    async def download_bulk(cls, request: Request, priority: int = 0):
+        entries: Dict[str, str] = {}
+        rejected = []
+        for raw_url in await read_bulk_urls(request):
+            url, valid = validate_url(raw_url)
+            if valid:
+                entries[url] = valid
+            else:
+                rejected.append(raw_url)
+        if not entries:
+            raise HTTPException(status_code=400, detail="NO_VALID_URLS")
+        if rejected:
+            logger.info(f"Bulk download rejected {len(rejected)} invalid urls")
+
+        tracker_id = f"bulk/{uuid.uuid4().hex}"
+        job_queue.enqueue(tracker_id, "bulk", priority, list(entries.items()))
+        logger.info(f"Queued bulk download {tracker_id} with {len(entries)} urls")
+        response = templates.TemplateResponse(
+            "components/progress.jinja",
+            {"request": request, "tracker_id": tracker_id}
+        )
+        response.headers["X-Bulk-Accepted"] = str(len(entries))
+        response.headers["X-Bulk-Rejected"] = str(len(rejected))
+        return response
+
+    @staticmethod
+    async def jobs():
+        return job_queue.list()
+
+    @staticmethod
+    async def cancel_job(job_id: int):
+        job = job_queue.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="JOB_NOT_FOUND")
+        return job
+
+    @staticmethod
+    async def pause_job(job_id: int):
+        job = job_queue.pause(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="JOB_NOT_FOUND")
+        return job
+
+    @staticmethod
+    async def resume_job(job_id: int):
+        job = job_queue.resume(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="JOB_NOT_FOUND")
+        return job
+
+    @staticmethod
+    async def library():
+        return library_index.stats()
+
+    @staticmethod
+    async def library_duplicates(limit: int = 100):
+        return library_index.duplicates(limit)
+
+    @staticmethod
+    async def library_files(
+        song_id: Optional[str] = None,
+        album_id: Optional[str] = None,
+        artist: Optional[str] = None,
+        album: Optional[str] = None,
+        limit: int = 100,
+    ):
+        if not any((song_id, album_id, artist, album)):
+            raise HTTPException(status_code=400, detail="MISSING_FILTER")
+        return library_index.find(song_id, album_id, artist, album, limit)
+
+    @staticmethod
+    async def library_scan(full: bool = False):
+        library_index.request_scan(full)
+        return {"scan_requested": True, "full": full}
+
+    @staticmethod
+    async def subscriptions():
+        return subscription_scheduler.list()
+
+    @staticmethod
+    async def subscribe(url: str, interval: Optional[float] = None, backfill: bool = False):
+        try:
+            return subscription_scheduler.subscribe(url, interval, backfill)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @staticmethod
+    async def unsubscribe(subscription_id: int):
+        if not subscription_scheduler.unsubscribe(subscription_id):
+            raise HTTPException(
+                status_code=404, detail="SUBSCRIPTION_NOT_FOUND")
+        return {"id": subscription_id}
+
+    @staticmethod
+    async def run_subscription(subscription_id: int):
+        subscription = subscription_scheduler.run_now(subscription_id)
+        if subscription is None:
+            raise HTTPException(
+                status_code=404, detail="SUBSCRIPTION_NOT_FOUND")
+        return subscription
+
+    @staticmethod
+    async def cover(url: str):
+        if not is_cover_url(url):
+            raise HTTPException(status_code=400, detail="INVALID_COVER_URL")
+        path = await asyncio.get_running_loop().run_in_executor(
+            None, cover_art.fetch, url)
+        if path is None:
+            raise HTTPException(status_code=404, detail="COVER_NOT_FOUND")
+        return FileResponse(
+            path,
+            media_type=cover_art.content_type(url),
+            headers={"Cache-Control": "public, max-age=86400"},
+        )
+
+    @staticmethod
+    async def metrics():
+        return PlainTextResponse(
+            render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
     @staticmethod
     async def progress(url: str, request: Request):
         url, valid = validate_url(url)
         if not valid:
             raise HTTPException(status_code=400, detail=url)
-        progress_trackers = get_progress_trackers_state()
-        tracker = None
-        for t in progress_trackers:
-            logger.debug(t["tracker_id"] + " " + url)
-            if t['tracker_id'] == url:
-                tracker = t
-                return templates.TemplateResponse(
-                    "components/progress.jinja",
-                    {"request": request, "tracker": tracker}
-                )
+        tracker = get_progress_tracker_state(url)
+        if tracker is not None:
+            return templates.TemplateResponse(
+                "components/progress.jinja",
+                {"request": request, "tracker": tracker}
+            )
         else:
             return templates.TemplateResponse(
                 "components/progress.jinja",
                 {"request": request, "tracker_id": url}
             )
 
+    @staticmethod
+    async def progress_stream(request: Request):
+        template = templates.get_template("components/progress.jinja")
+
+        def render(tracker_id: str) -> str:
+            tracker = get_progress_tracker_state(tracker_id)
+            if tracker is not None:
+                return template.render(tracker=tracker)
+            return template.render(tracker_id=tracker_id)
+
+        return StreamingResponse(
+            progress_stream.events(render, request.is_disconnected),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
 
 controller = APIController()
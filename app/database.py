@@ -0,0 +1,25 @@
+from .context import get_data_dir
+
+import sqlite3
+import logging
+
+
+logger = logging.getLogger("master")
+
+
+def connect(name: str) -> sqlite3.Connection:
+    """
+    Opens (and creates if needed) a SQLite database inside the data directory.
+
+    The connection is shared between threads, callers are expected to
+    serialize access with their own lock.
+    """
+    db_path = get_data_dir().joinpath(f"{name}.sqlite3")
+    logger.debug(f"Opening database: {db_path}")
+    connection = sqlite3.connect(
+        str(db_path), check_same_thread=False, isolation_level=None
+    )
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
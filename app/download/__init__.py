@@ -1,9 +1,23 @@
 from .download import validate_url, download
-from .progress_tracker import ProgressTracker, get_progress_trackers_state
+from .progress_tracker import (
+    ProgressTracker,
+    get_progress_trackers_state,
+    get_progress_tracker_state,
+)
+from .progress_stream import progress_stream, tracker_key
+from .job_queue import JobQueue, job_queue
+from .subscriptions import SubscriptionScheduler, subscription_scheduler
 
 __all__ = [
     "download",
+    "JobQueue",
+    "job_queue",
     "ProgressTracker",
     "validate_url",
     "get_progress_trackers_state",
+    "get_progress_tracker_state",
+    "SubscriptionScheduler",
+    "subscription_scheduler",
+    "progress_stream",
+    "tracker_key",
 ]
@@ -1,62 +1,50 @@
-from spotdl import SpotifyClient
 from spotdl.types.song import Song
-from spotdl.types.album import Album
-from spotdl.types.artist import Artist
-from spotdl.types.playlist import Playlist
-from spotdl.utils.config import create_settings
 from spotdl.download.progress_handler import SongTracker
-from spotdl.download.downloader import Downloader as Downloader_
-from spotdl.types.options import DownloaderOptionalOptions, DownloaderOptions
-from spotdl.download.progress_handler import ProgressHandler as ProgressHandler_
-import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 from datetime import datetime
 
 
-from .progress_tracker import ProgressTracker
-from .create_arguments import create_arguments
-from ..context import get_music_dir, clean, get_host_music_dir, get_playlists_dir
+from .progress_tracker import ProgressTracker, DownloadCancelled
+from .downloader_pool import downloader_pool
+from .in_flight import InFlightAlbum, in_flight_albums
+from .song_metrics import record_song_status, record_written_files
+from ..models.spotify_types import Album, Artist, Playlist, Track
+from ..library import cover_art, library_index
+from ..files import atomic_open
+from ..cache import metadata_cache
+from ..http_client import forget_spotify_responses
+from .playlist_sync import playlist_sync_store
+from ..context import (
+    get_music_dir,
+    clean,
+    get_host_music_dir,
+    get_playlists_dir,
+    get_album_metadata_concurrency,
+    get_album_download_concurrency,
+    get_music_format,
+)
 
 import os
 import logging
 from pathlib import Path
-from asyncio import AbstractEventLoop
-from typing import Any, Dict, List, Tuple, Callable, Type, TypeVar, cast
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Callable, Type, TypeVar, cast
+from functools import lru_cache
 from urllib.parse import urlparse, urlunparse
 from urllib.request import urlretrieve
 from dataclasses import dataclass, fields, is_dataclass
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 logger = logging.getLogger("master")
-spotify = SpotifyClient()
-
-
-class ProgressHandler(ProgressHandler_):
-    def __init__(
-        self,
-        simple_tui: bool = False,
-        update_callback: Callable[[Any, str], None] | None = None,
-        web_ui: bool = False,
-    ):
-        super().__init__(simple_tui, update_callback, web_ui)
-
-
-class Downloader(Downloader_):
-    def __init__(
-        self,
-        settings: DownloaderOptionalOptions | DownloaderOptions | None = None,
-        *,
-        loop: AbstractEventLoop | None = None,
-        update_callback=None,
-    ):
-        super().__init__(settings, loop)
-        self.progress_handler = ProgressHandler(
-            settings.get("simple_tui"), update_callback
-        )
 
 
-def get_music_format():
-    return os.getenv("MUSIC_FORMAT", "mp3")
+@lru_cache(maxsize=4096)
+def album_dir_name(album_name: str, artist_name: str) -> str:
+    """
+    Name of an album's directory. Memoized since playlist files resolve it
+    for every song, and most songs share their album with others.
+    """
+    return f"{clean(artist_name)} - {clean(album_name)}"
 
 
 def get_album_dir(album_name: str, artist_name: str) -> Path:
@@ -65,7 +53,7 @@ def get_album_dir(album_name: str, artist_name: str) -> Path:
 
     album_dir = (
         get_music_dir()
-        .joinpath(f"{clean(artist_name)} - {clean(album_name)}")
+        .joinpath(album_dir_name(album_name, artist_name))
         .absolute()
     )
     return album_dir
@@ -77,12 +65,34 @@ def get_host_album_dir(album_name: str, artist_name: str) -> Path:
 
     album_dir = (
         get_host_music_dir()
-        .joinpath(f"{clean(artist_name)} - {clean(album_name)}")
+        .joinpath(album_dir_name(album_name, artist_name))
         .absolute()
     )
     return album_dir
 
 
+def song_paths(
+    songs: Iterable[Song], get_dir: Callable[[str, str], Path]
+) -> Iterator[Tuple[Song, str]]:
+    """
+    Yields each song with the path of its file, resolving the directory of
+    each album once. Songs already in the library keep the format they are
+    stored in, the rest get the current format.
+    """
+    songs = list(songs)
+    music_format = get_music_format()
+    formats = library_index.formats([song.song_id for song in songs])
+    album_dirs: Dict[Tuple[str, str], str] = {}
+    for song in songs:
+        key = (song.album_name, song.artist)
+        album_dir = album_dirs.get(key)
+        if album_dir is None:
+            album_dir = album_dirs[key] = str(get_dir(*key))
+        yield song, os.path.join(
+            album_dir, f"{song.track_number} - {clean(song.name)}."
+            f"{formats.get(song.song_id, music_format)}")
+
+
 def update_callback(
     song_tracker: SongTracker, status: str, progress_tracker: ProgressTracker
 ):
@@ -94,8 +104,10 @@ def update_callback(
         progress_tracker, ProgressTracker
     ), "progress_tracker should be an instance of ProgressTracker"
 
-    logger.debug("Updating callback for song: "
-                 f"{song_tracker.song_name} with status: {status}")
+    # Called for every progress step of every song, so the message is only
+    # built if debug logging is on.
+    logger.debug("Updating callback for song: %s with status: %s",
+                 song_tracker.song_name, status)
     try:
         progress_tracker.update(song_tracker, status)
     except Exception as e:
@@ -133,6 +145,7 @@ def download_album(album: Album, progress_tracker: ProgressTracker):
             logger.error(
                 f"Album: {album} does not contain any songs. Skipping download."
             )
+            progress_tracker.finish_album(album)
             return
 
         album_dir = get_album_dir(album.name, album.songs[0].artist)
@@ -150,34 +163,32 @@ def download_album(album: Album, progress_tracker: ProgressTracker):
             logger.error(f"Cannot write to album directory: {album_dir}")
             raise PermissionError(
                 f"Cannot write to album directory: {album_dir}")
-        progress_tracker.start_new_album(album)
-
-        arguments = create_arguments(
-            operation="sync",
-            query=[album],
-            headless=True,
-            output=str(album_dir.joinpath(
-                "{track-number} - {title}.{output-ext}")),
-            format=get_music_format(),
-            save_file=album_dir.joinpath(f"{clean(album.name)}.spotdl"),
-            simple_tui=True,
-            sync_without_deleting=True,
-            log_level="DEBUG",
-            overwrite="skip",
-            preload=True,
-        )
-
-        _, downloader_settings, _ = create_settings(arguments)
-        downloader = Downloader(
-            downloader_settings,
-            update_callback=lambda tracker, status: update_callback(
-                tracker, status, progress_tracker
-            ),
-        )
-
-        downloader.download_multiple_songs(album.songs)
+        while True:
+            in_flight, owner = in_flight_albums.claim(album, progress_tracker)
+            if owner:
+                break
+            try:
+                in_flight.wait(progress_tracker)
+            finally:
+                in_flight.detach(progress_tracker)
+            if in_flight.error is None:
+                progress_tracker.finish_album(album)
+                logger.info(f"Shared download completed for album: {album.name}")
+                return
+            logger.info(
+                f"Shared download of album {album.name} failed, taking it over")
+
+        try:
+            download_owned_album(album, album_dir, progress_tracker, in_flight)
+        except BaseException as e:
+            in_flight_albums.release(in_flight, str(e) or type(e).__name__)
+            raise
+        in_flight_albums.release(in_flight)
         logger.info(f"Download completed for album: {album.name}")
 
+    except DownloadCancelled:
+        logger.info(f"Download cancelled before album: {album.name}")
+        raise
     except AssertionError as ae:
         logger.error(f"Assertion error: {ae}")
         raise
@@ -189,11 +200,96 @@ def download_album(album: Album, progress_tracker: ProgressTracker):
         raise
 
 
+def download_owned_album(
+    album: Album,
+    album_dir: Path,
+    progress_tracker: ProgressTracker,
+    in_flight: InFlightAlbum,
+):
+    """
+    Downloads the songs of an album that are not in the library yet, and
+    reports song progress to every tracker attached to the in-flight album.
+    """
+    cover_url = album.songs[0].cover_url
+    # Fetched while the songs download.
+    cover_art.prefetch([cover_url])
+    missing_songs = library_index.missing_songs(album.songs)
+    present = len(album.songs) - len(missing_songs)
+    in_flight.complete_present(present)
+    if not missing_songs:
+        logger.info(f"All songs of album {album.name} are already present")
+    else:
+        logger.debug(
+            f"{present} of {len(album.songs)} songs "
+            f"of album {album.name} are already present"
+        )
+
+        def album_update_callback(song_tracker: SongTracker, status: str):
+            record_song_status(song_tracker, status)
+            in_flight.update(song_tracker, status, update_callback)
+
+        with downloader_pool.acquire(
+            output=str(album_dir.joinpath(
+                "{track-number} - {title}.{output-ext}")),
+            save_file=album_dir.joinpath(f"{clean(album.name)}.spotdl"),
+            update_callback=album_update_callback,
+            cancelled=progress_tracker.cancelled,
+        ) as downloader:
+            results = downloader.download_multiple_songs(missing_songs)
+        library_index.record_results(results)
+        record_written_files(results)
+        progress_tracker.raise_if_cancelled()
+    cover_art.copy_to(cover_url, album_dir.joinpath("folder.jpg"))
+    progress_tracker.finish_album(album)
+
+
+def download_albums(album_urls: List[str], progress_tracker: ProgressTracker):
+    """
+    Fetches album metadata and downloads albums using two bounded pools, so a
+    slow album does not hold back the rest of an artist or playlist.
+
+    With both concurrency settings at 1 albums are still handled one at a
+    time, the next album's metadata is just fetched while the current one
+    downloads.
+    """
+    metadata_concurrency = get_album_metadata_concurrency()
+    download_concurrency = get_album_download_concurrency()
+    logger.debug(
+        f"Downloading {len(album_urls)} albums with metadata concurrency "
+        f"{metadata_concurrency} and download concurrency {download_concurrency}"
+    )
+
+    def fetch_album(album_url: str) -> Album:
+        progress_tracker.raise_if_cancelled()
+        return Album.from_url(album_url)
+
+    with ThreadPoolExecutor(
+        metadata_concurrency, thread_name_prefix="album-metadata"
+    ) as metadata_pool, ThreadPoolExecutor(
+        download_concurrency, thread_name_prefix="album-download"
+    ) as download_pool:
+        metadata_futures = [
+            metadata_pool.submit(fetch_album, album_url) for album_url in album_urls
+        ]
+        download_futures = []
+        try:
+            for future in as_completed(metadata_futures):
+                album = future.result()
+                download_futures.append(
+                    download_pool.submit(download_album, album, progress_tracker)
+                )
+            for future in as_completed(download_futures):
+                future.result()
+        except BaseException:
+            for future in metadata_futures + download_futures:
+                future.cancel()
+            progress_tracker.cancel()
+            raise
+
+
 def download_artist(artist: Artist, progress_tracker: ProgressTracker):
-    for album_url in artist.albums:
-        album = Album.from_url(album_url)
-        download_album(album, progress_tracker)
-    progress_tracker.finish()
+    with progress_tracker:
+        download_albums(artist.albums, progress_tracker)
 
 
 @dataclass
@@ -207,8 +303,14 @@ class _DownloadPlaylist_PlaylistMetadata:
 
 
 def download_playlist(
-    playlist_metadata: _DownloadPlaylist_PlaylistMetadata, songs: List[Song]
+    playlist_metadata: _DownloadPlaylist_PlaylistMetadata,
+    songs: List[Song],
+    new_songs: Optional[List[Song]] = None,
 ):
+    """
+    Writes the playlist file for all songs and downloads the albums of
+    new_songs, which defaults to every song of the playlist.
+    """
     try:
         playlist_metadata = verify_dataclass(
             playlist_metadata, _DownloadPlaylist_PlaylistMetadata
@@ -216,23 +318,33 @@ def download_playlist(
 
         create_xml(playlist_metadata, songs)
 
-        album_ids = {song.album_id for song in songs}
-        progress_tracker = ProgressTracker(
+        new_songs = songs if new_songs is None else new_songs
+        album_ids = {song.album_id for song in new_songs}
+        tracks_counts = {song.album_id: song.tracks_count for song in new_songs}
+        missing_album_ids = [
+            album_id for album_id in album_ids
+            if not library_index.is_album_complete(album_id, tracks_counts[album_id])
+        ]
+        logger.info(
+            f"{len(album_ids) - len(missing_album_ids)} of {len(album_ids)} albums "
+            "of the playlist are already present"
+        )
+        with ProgressTracker(
             playlist_metadata.url,
             len(album_ids),
             image_url=playlist_metadata.cover_url,
             name=playlist_metadata.name,
-        )
-        if progress_tracker is None:
-            raise Exception("Download already exists")
-        for album_id in album_ids:
-            album = Album.from_url(
-                f"https://open.spotify.com/album/{album_id}")
-            download_album(album, progress_tracker)
-
-        progress_tracker.finish()
+        ) as progress_tracker:
+            progress_tracker.skip_albums(len(album_ids) - len(missing_album_ids))
+            download_albums(
+                [f"https://open.spotify.com/album/{album_id}"
+                    for album_id in missing_album_ids],
+                progress_tracker,
+            )
 
         logger.debug("Finished downloading playlist.")
+    except DownloadCancelled:
+        raise
     except AssertionError as ae:
         logger.error(f"Assertion error: {ae}")
         raise
@@ -241,27 +353,14 @@ def download_playlist(
         raise
 
 
-def download_image(url, save_path):
-    try:
-        logger.debug(f"Downloading image from URL: {url}")
-        response = requests.get(url, stream=True, verify=False)
-        response.raise_for_status()
-
-        with open(save_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-
-        logger.debug(f"Image successfully downloaded to {save_path}")
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error downloading the image: {e}")
-
-
 def download(
     url,
     type_,
+    entries: Optional[List[Tuple[str, str]]] = None,
 ):
     match type_:
+        case "bulk":
+            download_bulk(url, entries)
         case "album":
             download_album_from_url(url)
         case "artist":
@@ -269,11 +368,61 @@ def download(
         case "playlist":
             download_playlist_from_url(url)
         case "track":
-            song = Song.from_url(url)
+            _, song = Track.get_metadata(url)
             url = "https://open.spotify.com/album/" + song.album_id
             download_album_from_url(url)
 
 
+def download_bulk(tracker_id: str, entries: List[Tuple[str, str]]):
+    """
+    Downloads a batch of validated (url, type) entries as one job. Every
+    entry is expanded to album ids first, so albums shared between entries
+    are downloaded once and progress covers the whole batch. Entries that
+    could not be expanded are reported as the error of the tracker, and
+    fail the job when none could be.
+    """
+    album_ids: Dict[str, None] = {}
+    failed: List[str] = []
+    for url, type_ in entries:
+        try:
+            match type_:
+                case "album":
+                    album_ids[url.rstrip("/").rsplit("/", 1)[-1]] = None
+                case "track":
+                    _, song = Track.get_metadata(url)
+                    album_ids[song.album_id] = None
+                case "artist":
+                    album_ids.update(dict.fromkeys(Artist.get_album_ids(url)))
+                case "playlist":
+                    playlist_metadata, songs, _ = Playlist.get_metadata(url)
+                    create_xml(playlist_metadata, songs)
+                    album_ids.update(dict.fromkeys(song.album_id for song in songs))
+        except Exception as e:
+            logger.error(f"Failed to expand bulk entry {url}: {e}")
+            failed.append(url)
+
+    logger.info(
+        f"Bulk download {tracker_id}: {len(entries)} entries, "
+        f"{len(album_ids)} unique albums"
+    )
+    with ProgressTracker(
+        tracker_id,
+        total_albums=len(album_ids),
+        name=f"{len(entries)} items · {len(album_ids)} albums",
+    ) as progress_tracker:
+        download_albums(
+            [f"https://open.spotify.com/album/{album_id}" for album_id in album_ids],
+            progress_tracker,
+        )
+        if failed:
+            error = (f"Failed to read {len(failed)} of {len(entries)} entries: "
+                     f"{', '.join(failed)}")
+            # Nothing at all to download fails the job as well.
+            if not album_ids:
+                raise RuntimeError(error)
+            progress_tracker.finish(error=error)
+
+
 @dataclass
 class _CreateM3U8PlaylistMetadata:
     name: str
@@ -292,37 +441,27 @@ def create_m3u8(playlist_metadata: _CreateM3U8PlaylistMetadata, songs: List[Song
             playlist_metadata, _CreateM3U8PlaylistMetadata
         )
 
-        m3u8_content = []
-
-        m3u8_content.append(f"#EXTM3U")
-        m3u8_content.append(f"#PLAYLIST:{clean(playlist_metadata.name)}")
-        m3u8_content.append(f"#URL:{playlist_metadata.url}")
-        m3u8_content.append(
-            f"#DESCRIPTION:{clean(playlist_metadata.description)}")
-        m3u8_content.append(f"#AUTHOR:{clean(playlist_metadata.author_name)}")
-        m3u8_content.append(f"#AUTHOR_URL:{playlist_metadata.author_url}")
-        m3u8_content.append(f"#COVER_URL:{playlist_metadata.cover_url}")
-        m3u8_content.append("")
-
-        for song in songs:
-            album_dir = get_album_dir(song.album_name, song.artist)
-            song_path = album_dir.joinpath(
-                f"{song.track_number} - "
-                f"{clean(song.name)}.{get_music_format()}"
-            )
-            m3u8_content.append(
-                f"#EXTINF:{song.duration},"
-                f"{clean(song.artist)} - {clean(song.name)}"
-            )
-            m3u8_content.append(str(song_path))
-            m3u8_content.append("")
-
         m3u8_path = get_music_dir().joinpath(
             f"{clean(playlist_metadata.name)} by "
             f"{clean(playlist_metadata.author_name)}.m3u8"
         )
         logger.debug(f"Writing m3u8 content to file: {m3u8_path}")
-        m3u8_path.write_text("\n".join(m3u8_content), encoding="utf-8")
+        with atomic_open(m3u8_path) as m3u8_file:
+            m3u8_file.write(
+                f"#EXTM3U\n"
+                f"#PLAYLIST:{clean(playlist_metadata.name)}\n"
+                f"#URL:{playlist_metadata.url}\n"
+                f"#DESCRIPTION:{clean(playlist_metadata.description)}\n"
+                f"#AUTHOR:{clean(playlist_metadata.author_name)}\n"
+                f"#AUTHOR_URL:{playlist_metadata.author_url}\n"
+                f"#COVER_URL:{playlist_metadata.cover_url}\n"
+            )
+            for song, song_path in song_paths(songs, get_album_dir):
+                m3u8_file.write(
+                    f"\n#EXTINF:{song.duration},"
+                    f"{clean(song.artist)} - {clean(song.name)}\n"
+                    f"{song_path}\n"
+                )
         logger.debug(f"m3u8 file created: {m3u8_path}")
     except ValueError as ve:
         logger.error(f"Value error: {ve}")
@@ -337,42 +476,27 @@ def create_xml(playlist_metadata: _CreateM3U8PlaylistMetadata, songs: List[Song]
     try:
         playlist_metadata = verify_dataclass(
             playlist_metadata, _CreateM3U8PlaylistMetadata)
-        root = ET.Element("Item")
-
-        added = ET.SubElement(root, "Added")
-        added.text = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        lock_data = ET.SubElement(root, "LockData")
-        lock_data.text = "false"
-
-        local_title = ET.SubElement(root, "LocalTitle")
-        local_title.text = clean(playlist_metadata.name)
-
-        running_time = ET.SubElement(root, "RunningTime")
-        running_time.text = str(sum(song.duration for song in songs))
-
-        playlist_items = ET.SubElement(root, "PlaylistItems")
-
-        for song in songs:
-            playlist_item = ET.SubElement(playlist_items, "PlaylistItem")
-            song_path = ET.SubElement(playlist_item, "Path")
-
-            album_dir = get_host_album_dir(song.album_name, song.artist)
-            song_path.text = str(album_dir.joinpath(
-                f"{song.track_number} - {clean(song.name)}.{get_music_format()}"))
-
-        xml_content = ET.tostring(root, encoding='unicode', method='xml')
-
         xml_path = get_playlists_dir().joinpath(
             f"{clean(playlist_metadata.name)}")
 
-        xml_path.mkdir(parents=True, exist_ok=True)
-
-        with open(xml_path.joinpath(f"{clean(playlist_metadata.name)}.xml"), "w", encoding="utf-8") as xml_file:
-            xml_file.write(xml_content)
+        # Written element by element rather than built as a tree, so memory
+        # use does not grow with the size of the playlist.
+        with atomic_open(xml_path.joinpath(f"{clean(playlist_metadata.name)}.xml")) as xml_file:
+            xml_file.write(
+                "<Item>"
+                f"<Added>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</Added>"
+                "<LockData>false</LockData>"
+                f"<LocalTitle>{escape(clean(playlist_metadata.name))}</LocalTitle>"
+                f"<RunningTime>{sum(song.duration for song in songs)}</RunningTime>"
+                "<PlaylistItems>"
+            )
+            for _, song_path in song_paths(songs, get_host_album_dir):
+                xml_file.write(
+                    f"<PlaylistItem><Path>{escape(song_path)}</Path></PlaylistItem>")
+            xml_file.write("</PlaylistItems></Item>")
 
-        download_image(playlist_metadata.cover_url,
-                       str(xml_path.joinpath("folder.jpg").absolute()))
+        cover_art.copy_to(playlist_metadata.cover_url,
+                          xml_path.joinpath("folder.jpg").absolute())
 
         logger.debug(f"XML file created: {xml_path}")
 
@@ -385,20 +509,20 @@ def create_xml(playlist_metadata: _CreateM3U8PlaylistMetadata, songs: List[Song]
 
 
 def download_album_from_url(url):
+    metadata, songs = Album.get_metadata(url)
     album = Album.from_url(url)
-    metadata = spotify.album(album.url)
-    progress_tracker = ProgressTracker(
+    with ProgressTracker(
         album.url,
         total_albums=1,
         image_url=metadata["images"][0]["url"],
         name=album.name,
-    )
-    download_album(album, progress_tracker)
+    ) as progress_tracker:
+        download_album(album, progress_tracker)
 
 
 def download_artist_from_url(url):
+    metadata, songs = Artist.get_metadata(url)
     artist = Artist.from_url(url)
-    metadata = spotify.artist(artist.url)
     progress_tracker = ProgressTracker(
         artist.url,
         total_albums=len(artist.albums),
@@ -409,8 +533,55 @@ def download_artist_from_url(url):
 
 
 def download_playlist_from_url(url):
-    playlist_metadata, songs = Playlist.get_metadata(url)
-    download_playlist(playlist_metadata, songs)
+    snapshot_id = Playlist.get_snapshot_id(url)
+    previous_sync = playlist_sync_store.get(url)
+
+    unchanged = previous_sync is not None and previous_sync["snapshot_id"] == snapshot_id
+    # Synced songs whose files were deleted since are downloaded again.
+    gone_ids = library_index.missing_song_ids(previous_sync["track_ids"]) if unchanged else set()
+    if unchanged and not gone_ids:
+        logger.info(f"Playlist {url} is unchanged since {previous_sync['synced_at']}")
+        with ProgressTracker(
+            url,
+            total_albums=0,
+            image_url=previous_sync["cover_url"],
+            name=previous_sync["name"],
+        ):
+            return
+
+    if gone_ids:
+        logger.info(f"Playlist {url} is unchanged but {len(gone_ids)} songs are gone")
+        previous_sync = {**previous_sync, "track_ids": previous_sync["track_ids"] - gone_ids}
+    elif previous_sync is not None:
+        # The cached metadata may predate the new snapshot.
+        metadata_cache.invalidate(("playlist", url))
+        metadata_cache.invalidate(("playlist_summary", url))
+        forget_spotify_responses(url.rstrip("/").rsplit("/", 1)[-1])
+    playlist_metadata, songs, song_ids = Playlist.get_metadata(url)
+
+    new_songs = songs
+    if previous_sync is not None:
+        new_songs = [
+            song for song in songs if song.song_id not in previous_sync["track_ids"]
+        ]
+        logger.info(
+            f"Playlist {url} changed, {len(new_songs)} new of {len(songs)} songs"
+        )
+
+    download_playlist(playlist_metadata, songs, new_songs)
+    # Only songs that made it into the library count as synced, so the next
+    # sync retries the rest. The snapshot is only kept once nothing is
+    # missing, otherwise an unchanged playlist would never be looked at again.
+    missing_ids = {song.song_id for song in library_index.missing_songs(songs)}
+    if missing_ids:
+        logger.info(f"Playlist {url} synced with {len(missing_ids)} songs missing")
+    playlist_sync_store.save(
+        url,
+        "" if missing_ids else snapshot_id,
+        playlist_metadata["name"],
+        playlist_metadata["cover_url"],
+        song_ids - missing_ids,
+    )
 
 
 _DataclassT = TypeVar("_DataclassT")
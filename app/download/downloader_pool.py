@@ -0,0 +1,136 @@
+from spotdl.types.song import Song
+from spotdl.utils.config import create_settings
+from spotdl.download.downloader import Downloader as Downloader_
+from spotdl.types.options import DownloaderOptionalOptions, DownloaderOptions
+from spotdl.download.progress_handler import ProgressHandler as ProgressHandler_
+
+from .create_arguments import create_arguments
+from ..context import get_music_format
+from ..metrics import header, register_collector, sample
+
+import logging
+from asyncio import AbstractEventLoop
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+
+__all__ = ["Downloader", "DownloaderPool", "ProgressHandler", "downloader_pool"]
+
+logger = logging.getLogger("master")
+
+
+class ProgressHandler(ProgressHandler_):
+    def __init__(
+        self,
+        simple_tui: bool = False,
+        update_callback: Callable[[Any, str], None] | None = None,
+        web_ui: bool = False,
+    ):
+        super().__init__(simple_tui, update_callback, web_ui)
+
+
+class Downloader(Downloader_):
+    def __init__(
+        self,
+        settings: DownloaderOptionalOptions | DownloaderOptions | None = None,
+        *,
+        loop: AbstractEventLoop | None = None,
+        update_callback=None,
+    ):
+        super().__init__(settings, loop)
+        self.progress_handler = ProgressHandler(
+            settings.get("simple_tui"), update_callback
+        )
+        self.cancelled: Event | None = None
+
+    async def pool_download(self, song: Song) -> Tuple[Song, Path | None]:
+        # Checked once the song gets a download slot, so a cancelled album
+        # stops after the songs already downloading.
+        async with self.semaphore:
+            if self.cancelled is not None and self.cancelled.is_set():
+                return song, None
+            return await self.async_search_and_download(song)
+
+
+def create_downloader(music_format: str) -> Downloader:
+    arguments = create_arguments(
+        operation="sync",
+        query=[],
+        headless=True,
+        format=music_format,
+        simple_tui=True,
+        sync_without_deleting=True,
+        log_level="DEBUG",
+        overwrite="skip",
+        preload=True,
+    )
+    _, downloader_settings, _ = create_settings(arguments)
+    return Downloader(downloader_settings)
+
+
+class DownloaderPool:
+    """
+    Keeps idle spotdl downloaders around so the audio providers, yt-dlp
+    instances, ffmpeg checks and event loop are set up once per worker
+    instead of once per album.
+
+    Downloaders are handed out one caller at a time, the pool grows to the
+    number of albums downloading at once and never shrinks.
+    """
+
+    def __init__(self):
+        self.idle: Dict[str, List[Downloader]] = defaultdict(list)
+        self.lock = Lock()
+        self.created = 0
+
+    @contextmanager
+    def acquire(
+        self,
+        output: str,
+        save_file: Path,
+        update_callback: Callable[[Any, str], None],
+        cancelled: Event | None = None,
+    ) -> Iterator[Downloader]:
+        music_format = get_music_format()
+        with self.lock:
+            downloader = (
+                self.idle[music_format].pop() if self.idle[music_format] else None
+            )
+
+        if downloader is None:
+            logger.debug(f"Creating a new {music_format} downloader")
+            downloader = create_downloader(music_format)
+            with self.lock:
+                self.created += 1
+
+        downloader.settings["output"] = output
+        downloader.settings["save_file"] = str(save_file)
+        downloader.progress_handler.update_callback = update_callback
+        downloader.cancelled = cancelled
+        try:
+            yield downloader
+        finally:
+            downloader.progress_handler.update_callback = None
+            downloader.cancelled = None
+            with self.lock:
+                self.idle[music_format].append(downloader)
+
+
+downloader_pool = DownloaderPool()
+
+
+def collect_metrics() -> List[str]:
+    with downloader_pool.lock:
+        created = downloader_pool.created
+        idle = sum(len(downloaders) for downloaders in downloader_pool.idle.values())
+    lines = header("jmm_downloaders_created_total", "counter", "spotdl downloaders created.")
+    lines.append(sample("jmm_downloaders_created_total", created))
+    lines.extend(header("jmm_downloaders_idle", "gauge", "spotdl downloaders waiting in the pool."))
+    lines.append(sample("jmm_downloaders_idle", idle))
+    return lines
+
+
+register_collector(collect_metrics)
@@ -0,0 +1,114 @@
+from .progress_tracker import ProgressTracker
+
+from spotdl.types.album import Album
+from spotdl.download.progress_handler import SongTracker
+
+import logging
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+__all__ = ["InFlightAlbum", "InFlightAlbums", "in_flight_albums"]
+
+logger = logging.getLogger("master")
+
+
+class InFlightAlbum:
+    """
+    An album being downloaded, together with every tracker waiting on it.
+    The first tracker owns the download, the others only follow its progress.
+
+    The songs completed so far are counted here, so a tracker attaching
+    halfway starts where the download is instead of at zero.
+    """
+
+    def __init__(self, album: Album, owner: ProgressTracker):
+        self.album = album
+        self.album_id = album.songs[0].album_id
+        self.trackers: List[ProgressTracker] = []
+        self.completed = 0
+        self.done = Event()
+        self.error: Optional[str] = None
+        self.lock = Lock()
+        self.attach(owner)
+
+    def attach(self, tracker: ProgressTracker):
+        with self.lock:
+            # Started under the lock, so no update is counted twice or lost.
+            tracker.start_new_album(self.album, completed=self.completed)
+            self.trackers.append(tracker)
+
+    def detach(self, tracker: ProgressTracker):
+        with self.lock:
+            if tracker in self.trackers:
+                self.trackers.remove(tracker)
+
+    def complete_present(self, count: int):
+        """
+        Counts the songs that were already in the library as completed.
+        """
+        with self.lock:
+            self.completed += count
+            trackers = list(self.trackers)
+        for tracker in trackers:
+            tracker.complete_songs(self.album_id, count)
+
+    def update(
+        self,
+        song_tracker: SongTracker,
+        status: str,
+        callback: Callable[[SongTracker, str, ProgressTracker], None],
+    ):
+        """
+        Passes a song update of the download to every attached tracker.
+        """
+        with self.lock:
+            if status == "Done" or status == "Skipped":
+                self.completed += 1
+            trackers = list(self.trackers)
+        for tracker in trackers:
+            callback(song_tracker, status, tracker)
+
+    def wait(self, tracker: ProgressTracker):
+        """
+        Blocks a follower until the owner is done. A cancelled follower stops
+        waiting, the download itself continues.
+        """
+        while not self.done.wait(timeout=1):
+            tracker.raise_if_cancelled()
+
+
+class InFlightAlbums:
+    def __init__(self):
+        self.albums: Dict[str, InFlightAlbum] = {}
+        self.lock = Lock()
+
+    def claim(
+        self, album: Album, tracker: ProgressTracker
+    ) -> Tuple[InFlightAlbum, bool]:
+        """
+        Returns the in-flight entry for the album and whether the caller
+        owns the download. Either way the album is started on the tracker.
+        """
+        album_id = album.songs[0].album_id
+        with self.lock:
+            in_flight = self.albums.get(album_id)
+            if in_flight is None:
+                in_flight = self.albums[album_id] = InFlightAlbum(album, tracker)
+                return in_flight, True
+        in_flight.attach(tracker)
+        logger.info(
+            f"Album {album_id} is already downloading, "
+            f"{tracker.tracker_id} attaches to it"
+        )
+        return in_flight, False
+
+    def release(self, album: InFlightAlbum, error: Optional[str] = None):
+        with self.lock:
+            if self.albums.get(album.album_id) is album:
+                del self.albums[album.album_id]
+        album.error = error
+        album.done.set()
+
+
+in_flight_albums = InFlightAlbums()
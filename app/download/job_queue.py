@@ -0,0 +1,300 @@
+from .download import download
+from .progress_tracker import (
+    DownloadCancelled,
+    DownloadInProgress,
+    cancel_progress_tracker,
+)
+from ..context import get_download_workers
+from ..database import connect
+from ..metrics import header, register_collector, sample
+
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+__all__ = ["JobQueue", "job_queue"]
+
+logger = logging.getLogger("master")
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING, PAUSED)
+
+# How long stop() waits for each worker to finish its current song.
+STOP_TIMEOUT = 30
+
+
+class JobQueue:
+    """
+    Durable download queue backed by SQLite and drained by a bounded pool of
+    worker threads.
+    """
+
+    def __init__(self, db_name: str = "jobs", workers: Optional[int] = None):
+        self.db_name = db_name
+        self.workers = workers
+        self.connection = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads: List[threading.Thread] = []
+        # job id -> url of the jobs the workers are running
+        self.running: Dict[int, str] = {}
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = connect(self.db_name)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    payload TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            columns = {
+                row["name"]
+                for row in self.connection.execute("PRAGMA table_info(jobs)")
+            }
+            if "payload" not in columns:
+                self.connection.execute("ALTER TABLE jobs ADD COLUMN payload TEXT")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status_priority "
+                "ON jobs (status, priority DESC, id)"
+            )
+        return self.connection
+
+    def _set_status(self, job_id: int, status: str, error: Optional[str] = None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, datetime.now().isoformat(), job_id),
+        )
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT * FROM jobs ORDER BY "
+                "CASE status WHEN 'running' THEN 0 WHEN 'queued' THEN 1 "
+                "WHEN 'paused' THEN 2 ELSE 3 END, priority DESC, id DESC "
+                "LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def enqueue(
+        self, url: str, type_: str, priority: int = 0, payload: Any = None
+    ) -> int:
+        """
+        Queues a download, returning the id of an existing unfinished job for
+        the same url instead of creating a duplicate. The payload is stored as
+        JSON and handed to download() as its third argument.
+        """
+        with self.lock:
+            connection = self._connect()
+            existing = connection.execute(
+                "SELECT id, priority FROM jobs WHERE url = ? AND status IN (?, ?, ?)",
+                (url, *ACTIVE_STATUSES),
+            ).fetchone()
+            if existing:
+                if priority > existing["priority"]:
+                    connection.execute(
+                        "UPDATE jobs SET priority = ? WHERE id = ?",
+                        (priority, existing["id"]),
+                    )
+                logger.debug(f"Job for {url} already queued: {existing['id']}")
+                return existing["id"]
+
+            now = datetime.now().isoformat()
+            job_id = connection.execute(
+                "INSERT INTO jobs (url, type, priority, status, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    type_,
+                    priority,
+                    QUEUED,
+                    json.dumps(payload) if payload is not None else None,
+                    now,
+                    now,
+                ),
+            ).lastrowid
+        logger.info(f"Queued job {job_id}: {type_} {url} (priority {priority})")
+        self.wakeup.set()
+        return job_id
+
+    def cancel(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return self._interrupt(job_id, CANCELLED)
+
+    def pause(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return self._interrupt(job_id, PAUSED)
+
+    def resume(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self._connect().execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            if job["status"] == PAUSED:
+                self._set_status(job_id, QUEUED)
+        self.wakeup.set()
+        return self.get(job_id)
+
+    def _interrupt(self, job_id: int, status: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self._connect().execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            if job["status"] in ACTIVE_STATUSES:
+                self._set_status(job_id, status)
+                if job["status"] == RUNNING:
+                    # The worker stops before the next song and keeps this
+                    # status, unless the job completed or failed anyway.
+                    cancel_progress_tracker(job["url"])
+        logger.info(f"Job {job_id} marked as {status}")
+        return self.get(job_id)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            connection = self._connect()
+            # A job resumed while its worker is still stopping waits for it.
+            running = list(self.running)
+            job = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? "
+                f"AND id NOT IN ({', '.join('?' * len(running))}) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (QUEUED, *running),
+            ).fetchone()
+            if job is None:
+                return None
+            self._set_status(job["id"], RUNNING)
+            self.running[job["id"]] = job["url"]
+            return dict(job)
+
+    def _finish(self, job_id: int, status: Optional[str], error: Optional[str] = None):
+        """
+        Records how a job ended. A job that completed or failed gets that
+        status even if it was cancelled or paused meanwhile. A job that was
+        interrupted (status None) keeps the status it was interrupted with,
+        or is cancelled if nothing else asked for it to stop. Jobs stopped
+        by stop() stay running and are resumed by the next start().
+        """
+        with self.lock:
+            del self.running[job_id]
+            job = self._connect().execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return
+            if status is not None:
+                self._set_status(job_id, status, error)
+            elif job["status"] == RUNNING and not self.stopping.is_set():
+                self._set_status(job_id, CANCELLED)
+        self.wakeup.set()
+
+    def _work(self):
+        while not self.stopping.is_set():
+            job = self._claim()
+            if job is None:
+                self.wakeup.wait(timeout=5)
+                self.wakeup.clear()
+                continue
+
+            logger.info(f"Starting job {job['id']}: {job['type']} {job['url']}")
+            try:
+                if job["payload"] is not None:
+                    download(job["url"], job["type"], json.loads(job["payload"]))
+                else:
+                    download(job["url"], job["type"])
+                self._finish(job["id"], DONE)
+                logger.info(f"Finished job {job['id']}")
+            except DownloadCancelled:
+                logger.info(f"Job {job['id']} interrupted")
+                self._finish(job["id"], None)
+            except DownloadInProgress:
+                logger.error(f"Job {job['id']} failed: download already running")
+                self._finish(job["id"], FAILED, "Download already running")
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                self._finish(job["id"], FAILED, str(e))
+
+    def start(self):
+        with self.lock:
+            # Anything left running by a previous process is resumed.
+            resumed = self._connect().execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (QUEUED, datetime.now().isoformat(), RUNNING),
+            ).rowcount
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished job(s)")
+
+        self.stopping.clear()
+        workers = self.workers or get_download_workers()
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._work, name=f"download-worker-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Started {workers} download worker(s)")
+
+    def stop(self):
+        """
+        Interrupts the running jobs and waits for the workers to exit.
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        with self.lock:
+            urls = list(self.running.values())
+        for url in urls:
+            cancel_progress_tracker(url)
+        for thread in self.threads:
+            thread.join(timeout=STOP_TIMEOUT)
+            if thread.is_alive():
+                logger.warning(f"{thread.name} did not stop in time")
+        self.threads.clear()
+
+
+job_queue = JobQueue()
+
+
+def collect_metrics() -> List[str]:
+    counts = job_queue.counts()
+    lines = header("jmm_jobs", "gauge", "Download jobs by status.")
+    for status in (QUEUED, RUNNING, PAUSED, CANCELLED, DONE, FAILED):
+        lines.append(sample("jmm_jobs", counts.get(status, 0), status=status))
+    return lines
+
+
+register_collector(collect_metrics)
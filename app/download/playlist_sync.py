@@ -0,0 +1,79 @@
+from ..database import connect
+
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+
+__all__ = ["PlaylistSyncStore", "playlist_sync_store"]
+
+logger = logging.getLogger("master")
+
+
+class PlaylistSyncStore:
+    """
+    Remembers the snapshot id and track ids of the last successful sync of
+    each playlist, so a resync can tell what changed.
+    """
+
+    def __init__(self, db_name: str = "playlists"):
+        self.db_name = db_name
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = connect(self.db_name)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS playlist_syncs (
+                    url TEXT PRIMARY KEY,
+                    snapshot_id TEXT NOT NULL,
+                    name TEXT,
+                    cover_url TEXT,
+                    track_ids TEXT NOT NULL,
+                    synced_at TEXT NOT NULL
+                )
+                """
+            )
+        return self.connection
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM playlist_syncs WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        sync = dict(row)
+        sync["track_ids"] = set(json.loads(sync["track_ids"]))
+        return sync
+
+    def save(
+        self,
+        url: str,
+        snapshot_id: str,
+        name: str,
+        cover_url: str,
+        track_ids: Iterable[str],
+    ):
+        with self.lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO playlist_syncs "
+                "(url, snapshot_id, name, cover_url, track_ids, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    snapshot_id,
+                    name,
+                    cover_url,
+                    json.dumps(sorted(track_ids)),
+                    datetime.now().isoformat(),
+                ),
+            )
+        logger.debug(f"Saved sync state of {url} at snapshot {snapshot_id}")
+
+
+playlist_sync_store = PlaylistSyncStore()
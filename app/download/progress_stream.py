@@ -0,0 +1,109 @@
+from .progress_tracker import add_progress_listener, remove_progress_listener
+from ..context import get_progress_stream_rate
+
+import asyncio
+import logging
+from threading import Lock
+from typing import AsyncIterator, Callable, Set
+
+
+__all__ = ["ProgressStream", "progress_stream", "tracker_key"]
+
+logger = logging.getLogger("master")
+
+KEEPALIVE_SECONDS = 15
+
+
+def tracker_key(tracker_id: str) -> str:
+    """
+    SSE event name for a tracker. Tracker ids are Spotify URLs, the last path
+    segment is the Spotify id which is unique and safe to use as a name.
+    """
+    return "progress-" + str(tracker_id).rstrip("/").rsplit("/", 1)[-1]
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.dirty: Set[str] = set()
+        self.event = asyncio.Event()
+
+    def mark(self, tracker_id: str):
+        self.dirty.add(tracker_id)
+        self.event.set()
+
+
+class ProgressStream:
+    """
+    Fans tracker changes out to connected SSE clients. Changes are coalesced
+    per client: a tracker updated many times between two flushes is sent once,
+    and each client is flushed at most PROGRESS_STREAM_RATE times per second.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[_Subscriber] = set()
+        self.lock = Lock()
+        self.listening = False
+
+    def publish(self, tracker_id: str):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.mark, tracker_id)
+            except RuntimeError:
+                # The client's event loop is closed, it is dropped on exit.
+                pass
+
+    def _subscribe(self) -> _Subscriber:
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if not self.listening:
+                add_progress_listener(self.publish)
+                self.listening = True
+        return subscriber
+
+    def _unsubscribe(self, subscriber: _Subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers and self.listening:
+                remove_progress_listener(self.publish)
+                self.listening = False
+
+    async def events(
+        self,
+        render: Callable[[str], str],
+        is_disconnected: Callable[[], "asyncio.Future[bool]"],
+    ) -> AsyncIterator[str]:
+        """
+        Yields server-sent events, one per changed tracker, with the event
+        name from tracker_key and the html returned by render as data.
+        """
+        subscriber = self._subscribe()
+        interval = 1 / get_progress_stream_rate()
+        logger.debug(f"Progress stream opened, {len(self.subscribers)} client(s)")
+        try:
+            while not await is_disconnected():
+                try:
+                    await asyncio.wait_for(
+                        subscriber.event.wait(), timeout=KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                subscriber.event.clear()
+                dirty, subscriber.dirty = subscriber.dirty, set()
+                for tracker_id in dirty:
+                    data = "\n".join(
+                        f"data: {line}" for line in render(tracker_id).splitlines()
+                    )
+                    yield f"event: {tracker_key(tracker_id)}\n{data}\n\n"
+                await asyncio.sleep(interval)
+        finally:
+            self._unsubscribe(subscriber)
+            logger.debug("Progress stream closed")
+
+
+progress_stream = ProgressStream()
@@ -1,25 +1,105 @@
 from spotdl.types.album import Album
 from spotdl.download.progress_handler import SongTracker
-from threading import Lock
-from typing import Callable, Optional
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional
+from collections import OrderedDict
 from dataclasses import dataclass
+from ..context import get_progress_history_size, get_progress_history_ttl
+from ..metrics import header, register_collector, sample
+import time
 import logging
 
 
-progress_trackers: list["ProgressTrackerType"] = []
+# Running trackers and a bounded history of finished ones, both keyed by
+# tracker id. Finished trackers are ordered by finish time so expiry only
+# ever looks at the front.
+progress_trackers: Dict[str, "ProgressTrackerType"] = {}
+finished_trackers: "OrderedDict[str, ProgressTrackerType]" = OrderedDict()
 progress_lock = Lock()
+progress_listeners: List[Callable[[str], None]] = []
 logger = logging.getLogger("master")
 
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+def add_progress_listener(listener: Callable[[str], None]):
+    """
+    Registers a callable that receives the tracker id whenever a tracker
+    changes. Listeners are called from download threads and must not block.
+    """
+    progress_listeners.append(listener)
+
+
+def remove_progress_listener(listener: Callable[[str], None]):
+    if listener in progress_listeners:
+        progress_listeners.remove(listener)
+
+
+def notify_progress_listeners(tracker_id: str):
+    for listener in list(progress_listeners):
+        try:
+            listener(tracker_id)
+        except Exception as e:
+            logger.error(f"Progress listener failed for {tracker_id}: {e}")
+
+
+def _expire_finished_trackers():
+    """
+    Drops finished trackers past their TTL or beyond the history size.
+    Callers must hold progress_lock.
+    """
+    expires_before = time.time() - get_progress_history_ttl()
+    history_size = get_progress_history_size()
+    while finished_trackers:
+        tracker_id, tracker = next(iter(finished_trackers.items()))
+        if len(finished_trackers) <= history_size and tracker.finished_at >= expires_before:
+            break
+        del finished_trackers[tracker_id]
+
+
+def _lookup(tracker_id: str) -> Optional["ProgressTrackerType"]:
+    _expire_finished_trackers()
+    return progress_trackers.get(tracker_id) or finished_trackers.get(tracker_id)
+
 
 def get_progress_trackers_state():
     """
-    Safely retrieves a ProgressTracker from the global progress_trackers dictionary.
+    Snapshot of running trackers followed by recently finished ones.
+    """
+    with progress_lock:
+        _expire_finished_trackers()
+        trackers = list(progress_trackers.values()) + \
+            list(reversed(finished_trackers.values()))
+    return [tracker.state() for tracker in trackers]
+
+
+def get_progress_tracker_state(tracker_id: str) -> Optional[dict]:
+    with progress_lock:
+        tracker = _lookup(tracker_id)
+    return tracker.state() if tracker else None
+
+
+def cancel_progress_tracker(tracker_id: str) -> bool:
+    """
+    Asks the download owning the given tracker to stop before its next song.
     """
     with progress_lock:
-        for tracker in progress_trackers:
-            if tracker.tracker.progress == 100:
-                progress_trackers.remove(tracker)
-        return [{"tracker_id": tracker.id, "name": tracker.name, "image_url": tracker.image_url, "progress": tracker.tracker.progress} for tracker in progress_trackers]
+        tracker = progress_trackers.get(tracker_id)
+    if tracker is None:
+        return False
+    tracker.tracker.cancel()
+    return True
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class DownloadInProgress(Exception):
+    pass
 
 
 @dataclass
@@ -28,11 +108,27 @@ class ProgressTrackerType:
     name: str
     image_url: str
     tracker: "ProgressTracker"
+    status: str = RUNNING
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+
+    def state(self) -> dict:
+        return {
+            "tracker_id": self.id,
+            "name": self.name,
+            "image_url": self.image_url,
+            "progress": self.tracker.progress,
+            "status": self.status,
+            "error": self.error,
+        }
 
 
 class ProgressTracker:
     """
     Class to track the overall progress of downloading albums and songs.
+
+    Used as a context manager the tracker is finished on exit, and marked
+    cancelled or failed if the block raised.
     """
 
     def __init__(
@@ -47,46 +143,100 @@ class ProgressTracker:
     ):
         self.tracker_id = tracker_id
         self.total_albums = total_albums
-        self.current_album_index = 0
-        self.total_songs = 0
-        self.completed_songs = 0
-        self.current_album = None
+        self.completed_albums = 0
+        # album id -> [completed songs, total songs] for albums in flight
+        self.active_albums: Dict[str, List[int]] = {}
         self.lock = Lock()
+        self.cancelled = Event()
+        self.finished = False
 
         with progress_lock:
-            if any(tracker.id == tracker_id for tracker in progress_trackers):
-                self = None
-                return
-            progress_trackers.append(ProgressTrackerType(id=tracker_id,
-                                                         name=name, image_url=image_url, tracker=self))
+            if tracker_id in progress_trackers:
+                raise DownloadInProgress(tracker_id)
+            finished_trackers.pop(tracker_id, None)
+            progress_trackers[tracker_id] = ProgressTrackerType(
+                id=tracker_id, name=name, image_url=image_url, tracker=self)
+        notify_progress_listeners(tracker_id)
 
         self.on_start_album = on_start_album
         self.on_update = on_update
         self.on_finish = on_finish
 
-    def start_new_album(self, album: Album):
+    def __enter__(self) -> "ProgressTracker":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.finish()
+        elif issubclass(exc_type, DownloadCancelled):
+            self.finish(status=CANCELLED)
+        else:
+            self.finish(status=FAILED, error=str(exc))
+        return False
+
+    def cancel(self):
+        logger.info(f"Cancelling {self.tracker_id}")
+        self.cancelled.set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled.is_set():
+            raise DownloadCancelled(self.tracker_id)
+
+    def start_new_album(self, album: Album, completed: int = 0):
+        self.raise_if_cancelled()
         with self.lock:
-            self.current_album = album
-            self.total_songs = len(album.songs)
-            self.current_album_index += 1
-            self.completed_songs = 0
+            self.active_albums[album.songs[0].album_id] = [
+                completed, len(album.songs)]
+        notify_progress_listeners(self.tracker_id)
 
         if getattr(self, "on_start_album", None):
             self.on_start_album(album)
 
+    def skip_albums(self, count: int):
+        with self.lock:
+            self.completed_albums += count
+        notify_progress_listeners(self.tracker_id)
+
+    def finish_album(self, album: Album):
+        with self.lock:
+            if album.songs:
+                self.active_albums.pop(album.songs[0].album_id, None)
+            self.completed_albums += 1
+        notify_progress_listeners(self.tracker_id)
+
+    def complete_songs(self, album_id: str, count: int):
+        with self.lock:
+            album_progress = self.active_albums.get(album_id)
+            if album_progress is not None:
+                album_progress[0] += count
+        notify_progress_listeners(self.tracker_id)
+
     def update(self, song_tracker: SongTracker, status: str):
         with self.lock:
             if status == "Done" or status == "Skipped":
-                self.completed_songs += 1
+                album_progress = self.active_albums.get(
+                    song_tracker.song.album_id)
+                if album_progress is not None:
+                    album_progress[0] += 1
+        notify_progress_listeners(self.tracker_id)
 
         if getattr(self, "on_update", None):
             self.on_update(song_tracker, status)
 
-    def finish(self):
-        logger.info(f"Finished {self.tracker_id}")
+    def finish(self, status: str = DONE, error: Optional[str] = None):
+        if self.finished:
+            return
+        self.finished = True
+        logger.info(f"Finished {self.tracker_id}: {status}")
         with progress_lock:
-            if self.tracker_id in progress_trackers:
-                del progress_trackers[self.tracker_id]
+            tracker = progress_trackers.pop(self.tracker_id, None)
+            if tracker is not None and tracker.tracker is self:
+                tracker.status = status
+                tracker.error = error
+                tracker.finished_at = time.time()
+                finished_trackers[self.tracker_id] = tracker
+                _expire_finished_trackers()
+        notify_progress_listeners(self.tracker_id)
 
         if getattr(self, "on_finish", None):
             self.on_finish()
@@ -94,12 +244,22 @@ class ProgressTracker:
     @property
     def progress(self) -> float:
         with self.lock:
-            if self.current_album is None:
-                return 0.0
-            else:
-                album_progress = (self.current_album_index - 1) / \
-                    self.total_albums * 100
-                current_album_song_progress = (
-                    self.completed_songs / len(self.current_album.songs)) * (1 / self.total_albums) * 100
-
-                return round(album_progress + current_album_song_progress, 2)
+            if not self.total_albums:
+                return 100.0 if self.finished else 0.0
+            albums_done = self.completed_albums + sum(
+                min(completed, total) / total
+                for completed, total in self.active_albums.values()
+                if total
+            )
+            return round(min(albums_done / self.total_albums, 1) * 100, 2)
+
+
+def collect_metrics() -> List[str]:
+    with progress_lock:
+        running = len(progress_trackers)
+    lines = header("jmm_downloads_running", "gauge", "Downloads currently running.")
+    lines.append(sample("jmm_downloads_running", running))
+    return lines
+
+
+register_collector(collect_metrics)
@@ -0,0 +1,63 @@
+from ..metrics import Counter, Histogram
+
+import os
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from spotdl.download.progress_handler import SongTracker
+from spotdl.types.song import Song
+
+
+__all__ = ["record_song_status", "record_written_files"]
+
+# spotdl progress messages and the pipeline stage each one starts.
+STAGES = {
+    "Searching for song": "search",
+    "Getting audio meta": "fetch",
+    "Downloading": "fetch",
+    "Converting": "ffmpeg",
+    "Embedding metadata": "tagging",
+}
+FINAL_STATUSES = {"Done": "done", "Skipped": "skipped", "Error": "failed"}
+
+songs_total = Counter(
+    "jmm_songs_total", "Songs finished by the downloader, by outcome.", ["status"])
+song_stage_seconds = Histogram(
+    "jmm_song_stage_seconds", "Time songs spend in each download stage.", ["stage"])
+bytes_written_total = Counter(
+    "jmm_bytes_written_total", "Bytes of audio files written by downloads.")
+
+# song tracker -> (stage, time it started)
+_current_stages: Dict[SongTracker, Tuple[str, float]] = {}
+_lock = threading.Lock()
+
+
+def record_song_status(song_tracker: SongTracker, status: str):
+    """
+    Feeds the metrics from the progress callback of a downloader. Called
+    once per callback, not once per progress tracker listening to it.
+    """
+    now = time.perf_counter()
+    stage = STAGES.get(status)
+    with _lock:
+        previous = _current_stages.get(song_tracker)
+        if previous is not None and previous[0] == stage:
+            return
+        if stage is None:
+            _current_stages.pop(song_tracker, None)
+        else:
+            _current_stages[song_tracker] = (stage, now)
+    if previous is not None:
+        song_stage_seconds.observe(now - previous[1], stage=previous[0])
+    if status in FINAL_STATUSES:
+        songs_total.inc(status=FINAL_STATUSES[status])
+
+
+def record_written_files(results: Iterable[Tuple[Song, Optional[Path]]]):
+    written = 0
+    for _, path in results:
+        if path is not None and os.path.exists(path):
+            written += os.path.getsize(path)
+    bytes_written_total.inc(written)
@@ -0,0 +1,317 @@
+from .download import validate_url
+from .job_queue import ACTIVE_STATUSES, CANCELLED, DONE, job_queue
+from .playlist_sync import playlist_sync_store
+from ..models.spotify_types import Artist, Playlist
+from ..ratelimit import TokenBucket
+from ..cache import metadata_cache
+from ..http_client import forget_spotify_responses
+from ..database import connect
+from ..context import (
+    get_subscription_interval,
+    get_subscription_jitter,
+    get_subscription_checks_per_minute,
+)
+
+import json
+import time
+import random
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+
+__all__ = ["SubscriptionScheduler", "subscription_scheduler"]
+
+logger = logging.getLogger("master")
+
+SUBSCRIBABLE_TYPES = ("artist", "playlist")
+
+# Subscription checks run at a lower priority than downloads started by hand.
+SUBSCRIPTION_PRIORITY = -10
+
+
+class SubscriptionScheduler:
+    """
+    Watches artists and playlists and queues downloads for what changed.
+
+    Due subscriptions are checked by a single background thread. Every check
+    takes a token from a global budget so a large watch list is spread out
+    instead of hitting Spotify at once, and the next run is jittered.
+    """
+
+    def __init__(self, db_name: str = "subscriptions"):
+        self.db_name = db_name
+        self.connection = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.budget = TokenBucket(get_subscription_checks_per_minute() / 60)
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = connect(self.db_name)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL UNIQUE,
+                    type TEXT NOT NULL,
+                    interval REAL NOT NULL,
+                    known_album_ids TEXT,
+                    pending_album_jobs TEXT,
+                    next_run_at REAL NOT NULL,
+                    last_run_at TEXT,
+                    last_status TEXT,
+                    last_error TEXT,
+                    last_duration_ms INTEGER,
+                    last_changes INTEGER,
+                    runs INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+            columns = {
+                row["name"]
+                for row in self.connection.execute("PRAGMA table_info(subscriptions)")
+            }
+            if "pending_album_jobs" not in columns:
+                self.connection.execute(
+                    "ALTER TABLE subscriptions ADD COLUMN pending_album_jobs TEXT")
+        return self.connection
+
+    def _next_run_at(self, interval: float) -> float:
+        jitter = get_subscription_jitter()
+        return time.time() + interval * random.uniform(1 - jitter, 1 + jitter)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT * FROM subscriptions ORDER BY id"
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def get(self, subscription_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM subscriptions WHERE id = ?", (subscription_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        subscription = dict(row)
+        subscription.pop("known_album_ids", None)
+        subscription.pop("pending_album_jobs", None)
+        subscription["next_run_at"] = datetime.fromtimestamp(
+            subscription["next_run_at"]).isoformat()
+        return subscription
+
+    def subscribe(
+        self, url: str, interval: Optional[float] = None, backfill: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Registers an artist or playlist. Unless backfill is set, the first
+        check of an artist only records its current albums. Playlists are
+        synced on their first check.
+        """
+        url, type_ = validate_url(url)
+        if type_ not in SUBSCRIBABLE_TYPES:
+            raise ValueError(
+                url if not type_ else "ONLY_ARTISTS_AND_PLAYLISTS")
+        interval = max(60.0, interval or get_subscription_interval())
+
+        with self.lock:
+            connection = self._connect()
+            existing = connection.execute(
+                "SELECT id FROM subscriptions WHERE url = ?", (url,)
+            ).fetchone()
+            if existing:
+                connection.execute(
+                    "UPDATE subscriptions SET interval = ? WHERE id = ?",
+                    (interval, existing["id"]),
+                )
+                subscription_id = existing["id"]
+            else:
+                subscription_id = connection.execute(
+                    "INSERT INTO subscriptions "
+                    "(url, type, interval, known_album_ids, next_run_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        url,
+                        type_,
+                        interval,
+                        json.dumps([]) if backfill else None,
+                        # Spread the first checks of a batch of new subscriptions.
+                        time.time() + random.uniform(0, 60),
+                        datetime.now().isoformat(),
+                    ),
+                ).lastrowid
+                logger.info(f"Subscribed to {type_} {url}")
+        self.wakeup.set()
+        return self.get(subscription_id)
+
+    def unsubscribe(self, subscription_id: int) -> bool:
+        with self.lock:
+            deleted = self._connect().execute(
+                "DELETE FROM subscriptions WHERE id = ?", (subscription_id,)
+            ).rowcount
+        return bool(deleted)
+
+    def run_now(self, subscription_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            updated = self._connect().execute(
+                "UPDATE subscriptions SET next_run_at = ? WHERE id = ?",
+                (time.time(), subscription_id),
+            ).rowcount
+        if not updated:
+            return None
+        self.wakeup.set()
+        return self.get(subscription_id)
+
+    @staticmethod
+    def _reconcile(
+        known_ids: Set[str], pending: Dict[str, int]
+    ) -> Dict[str, int]:
+        """
+        Moves albums whose download job finished to known_ids and returns
+        the jobs still pending. Albums whose job failed are dropped from
+        both, so the check queues them again.
+        """
+        still_pending = {}
+        for album_id, job_id in pending.items():
+            job = job_queue.get(job_id)
+            status = job["status"] if job else None
+            if status in ACTIVE_STATUSES:
+                still_pending[album_id] = job_id
+            elif status in (DONE, CANCELLED):
+                # A cancelled album was skipped on purpose.
+                known_ids.add(album_id)
+        return still_pending
+
+    def _check_artist(self, subscription: Dict[str, Any]) -> int:
+        # Both calls below go past every cache, so new releases show up.
+        album_ids = Artist.get_album_ids(subscription["url"])
+        known = subscription["known_album_ids"]
+        pending = json.loads(subscription["pending_album_jobs"] or "{}")
+        if known is None:
+            known_ids = set(album_ids)
+            new_album_ids = []
+        else:
+            known_ids = set(json.loads(known))
+            pending = self._reconcile(known_ids, pending)
+            new_album_ids = [
+                i for i in album_ids if i not in known_ids and i not in pending]
+
+        if new_album_ids:
+            # The artist view would otherwise show the old albums until the
+            # cached entries expire.
+            for namespace in ("artist", "artist_summary", "artist_albums_page"):
+                metadata_cache.invalidate_prefix(namespace, subscription["url"])
+            forget_spotify_responses(subscription["url"].rstrip("/").rsplit("/", 1)[-1])
+        for album_id in new_album_ids:
+            pending[album_id] = job_queue.enqueue(
+                f"https://open.spotify.com/album/{album_id}",
+                "album",
+                SUBSCRIPTION_PRIORITY,
+            )
+        # Albums only become known once their download is done, so a failed
+        # one is queued again by the next check.
+        with self.lock:
+            self._connect().execute(
+                "UPDATE subscriptions SET known_album_ids = ?, "
+                "pending_album_jobs = ? WHERE id = ?",
+                (
+                    json.dumps([i for i in album_ids if i in known_ids]),
+                    json.dumps(pending),
+                    subscription["id"],
+                ),
+            )
+        return len(new_album_ids)
+
+    def _check_playlist(self, subscription: Dict[str, Any]) -> int:
+        url = subscription["url"]
+        previous_sync = playlist_sync_store.get(url)
+        # The snapshot id is never cached. The playlist download invalidates
+        # the cached playlist when it changed.
+        if previous_sync is not None and \
+                previous_sync["snapshot_id"] == Playlist.get_snapshot_id(url):
+            return 0
+        # The playlist sync itself only downloads the tracks added since the
+        # last sync, and albums already in the library are skipped.
+        job_queue.enqueue(url, "playlist", SUBSCRIPTION_PRIORITY)
+        return 1
+
+    def _run(self, subscription: Dict[str, Any]):
+        start = time.perf_counter()
+        status, error, changes = "ok", None, 0
+        try:
+            if subscription["type"] == "artist":
+                changes = self._check_artist(subscription)
+            else:
+                changes = self._check_playlist(subscription)
+            logger.info(
+                f"Checked subscription {subscription['url']}: {changes} change(s)")
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"Subscription check failed for {subscription['url']}: {e}")
+
+        with self.lock:
+            self._connect().execute(
+                "UPDATE subscriptions SET next_run_at = ?, last_run_at = ?, "
+                "last_status = ?, last_error = ?, last_duration_ms = ?, "
+                "last_changes = ?, runs = runs + 1 WHERE id = ?",
+                (
+                    self._next_run_at(subscription["interval"]),
+                    datetime.now().isoformat(),
+                    status,
+                    error,
+                    int((time.perf_counter() - start) * 1000),
+                    changes,
+                    subscription["id"],
+                ),
+            )
+
+    def _due(self) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM subscriptions WHERE next_run_at <= ? "
+                "ORDER BY next_run_at LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _seconds_until_next(self) -> float:
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT MIN(next_run_at) FROM subscriptions"
+            ).fetchone()
+        if row[0] is None:
+            return 60.0
+        return min(60.0, max(0.0, row[0] - time.time()))
+
+    def _work(self):
+        while not self.stopping.is_set():
+            subscription = self._due()
+            if subscription is None:
+                self.wakeup.wait(timeout=self._seconds_until_next())
+                self.wakeup.clear()
+                continue
+            self.budget.acquire()
+            self._run(subscription)
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self._work, name="subscription-scheduler", daemon=True
+        )
+        self.thread.start()
+        logger.info("Started subscription scheduler")
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+
+subscription_scheduler = SubscriptionScheduler()
@@ -0,0 +1,50 @@
+import os
+import stat
+import secrets
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, Optional, Tuple
+
+
+__all__ = ["atomic_open"]
+
+
+def _create_temp(path: Path) -> Tuple[int, str]:
+    """
+    Creates an empty temporary file next to path. Unlike mkstemp, which
+    makes files readable by their owner only, the file gets 0666 minus the
+    umask like any other new file, so Jellyfin can read it under another
+    user.
+    """
+    while True:
+        tmp_path = str(path.with_name(f".{path.name}.{secrets.token_hex(4)}"))
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+@contextmanager
+def atomic_open(
+    path: Path, mode: str = "w", encoding: Optional[str] = "utf-8"
+) -> Iterator[IO]:
+    """
+    Opens a temporary file next to path and renames it over path once the
+    block finishes, so readers such as Jellyfin never see a partial file.
+    The temporary file is removed if the block raises. A file that is
+    replaced keeps its mode.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = _create_temp(path)
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as file:
+            yield file
+            try:
+                os.fchmod(file.fileno(), stat.S_IMODE(path.stat().st_mode))
+            except FileNotFoundError:
+                pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,290 @@
+from spotdl import SpotifyClient
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import TokenBucket
+from .metrics import header, register_collector, sample
+from .context import (
+    get_http_pool_size,
+    get_spotify_burst,
+    get_spotify_max_retries,
+    get_spotify_requests_per_second,
+)
+
+import time
+import random
+import logging
+import threading
+import requests
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+
+__all__ = [
+    "HTTPMetrics",
+    "RateLimiter",
+    "RateLimitedAdapter",
+    "create_session",
+    "forget_spotify_responses",
+    "fresh_spotify",
+    "http_session",
+    "session_stats",
+    "spotify",
+    "spotify_session",
+]
+
+logger = logging.getLogger("master")
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_FACTOR = 0.5
+MAX_BACKOFF = 60.0
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """
+    Seconds asked for by a Retry-After header, given either as a number of
+    seconds or as an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HTTPMetrics:
+    """
+    Counters of one session: requests sent, responses throttled with 429,
+    retries, and the seconds spent waiting on the limiter or a backoff.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.errors = 0
+        self.wait_seconds = 0.0
+
+    def record(self, status: Optional[int] = None, waited: float = 0.0, retry: bool = False):
+        with self.lock:
+            self.requests += 1
+            self.wait_seconds += waited
+            if status == 429:
+                self.throttled += 1
+            elif status is None or status >= 500:
+                self.errors += 1
+            if retry:
+                self.retries += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "errors": self.errors,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread using a session, with a pause that
+    all of them honour after a 429.
+
+    The rate is halved on every 429 and grows back by a tenth of the
+    configured rate per successful request, so a throttled client settles
+    below the limit instead of hitting it again in lockstep.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> float:
+        waited = 0.0
+        while True:
+            with self.lock:
+                delay = self.blocked_until - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+            waited += delay
+        return waited + self.bucket.acquire()
+
+    def throttled(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        with self.bucket.lock:
+            self.bucket.rate = max(self.max_rate / 10, self.bucket.rate / 2)
+        logger.info(
+            f"Spotify rate limited, pausing {seconds:.1f}s and lowering the rate "
+            f"to {self.bucket.rate:.2f}/s"
+        )
+
+    def succeeded(self):
+        if self.bucket.rate >= self.max_rate:
+            return
+        with self.bucket.lock:
+            self.bucket.rate = min(
+                self.max_rate, self.bucket.rate + self.max_rate / 10)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pool that waits on a RateLimiter before every
+    request and retries throttled or failed responses, honouring
+    Retry-After when the server sends it.
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        metrics: Optional[HTTPMetrics] = None,
+        max_retries: int = 0,
+        pool_size: int = 10,
+    ):
+        super().__init__(pool_connections=4, pool_maxsize=pool_size)
+        self.limiter = limiter
+        self.metrics = metrics or HTTPMetrics()
+        self.retries = max_retries
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            waited = self.limiter.wait() if self.limiter else 0.0
+            try:
+                response = super().send(request, **kwargs)
+            except requests.ConnectionError:
+                self.metrics.record(None, waited, retry=attempt > 0)
+                raise
+            self.metrics.record(response.status_code, waited, retry=attempt > 0)
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                if self.limiter and response.status_code < 400:
+                    self.limiter.succeeded()
+                return response
+
+            delay = retry_after(response)
+            if delay is None:
+                delay = BACKOFF_FACTOR * 2 ** attempt * random.uniform(0.5, 1.5)
+            delay = min(delay, MAX_BACKOFF)
+            if response.status_code == 429 and self.limiter:
+                # Every thread waits, not only the one that was throttled.
+                self.limiter.throttled(delay)
+            else:
+                time.sleep(delay)
+                with self.metrics.lock:
+                    self.metrics.wait_seconds += delay
+            logger.debug(
+                f"Retrying {request.url} after {response.status_code} in {delay:.1f}s")
+            response.close()
+            attempt += 1
+
+
+def create_session(
+    limiter: Optional[RateLimiter] = None, max_retries: int = 0
+) -> requests.Session:
+    session = requests.Session()
+    adapter = RateLimitedAdapter(
+        limiter, max_retries=max_retries, pool_size=get_http_pool_size()
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session_stats(session: requests.Session) -> Dict[str, Any]:
+    return session.get_adapter("https://").metrics.stats()
+
+
+# One rate limited session for the Spotify API and one plain pooled session
+# for everything else, such as cover art.
+spotify_session = create_session(
+    RateLimiter(get_spotify_requests_per_second(), get_spotify_burst()),
+    get_spotify_max_retries(),
+)
+http_session = create_session()
+
+# The client initialised in context, sending its requests through the shared
+# session instead of the one spotipy builds with its own retries.
+spotify = SpotifyClient()
+spotify._session = spotify_session
+
+
+class _SkipCache(threading.local):
+    """
+    Stands in for the no_cache flag spotdl reads before every request, so
+    one thread can skip the response cache while the others keep using it.
+    """
+    skip = False
+
+    def __bool__(self) -> bool:
+        return self.skip
+
+
+_skip_cache = _SkipCache()
+spotify.no_cache = _skip_cache
+
+
+@contextmanager
+def fresh_spotify() -> Iterator[None]:
+    """
+    Sends the Spotify requests this thread makes inside the block to Spotify
+    even if spotdl already holds a response. spotdl keeps every response
+    for the life of the process, so without this a playlist snapshot id or
+    an artist's album list would never change.
+    """
+    previous, _skip_cache.skip = _skip_cache.skip, True
+    try:
+        yield
+    finally:
+        _skip_cache.skip = previous
+
+
+def forget_spotify_responses(spotify_id: str):
+    """
+    Drops the responses spotdl holds for requests about an artist, album or
+    playlist, for when fresh_spotify showed that it changed.
+    """
+    # spotdl keys its cache by the JSON of the request url and arguments.
+    # Clients that do not talk to the Web API themselves have no cache.
+    cache = getattr(spotify, "cache", None) or {}
+    stale = [key for key in list(cache) if spotify_id in key]
+    for key in stale:
+        cache.pop(key, None)
+    logger.debug(f"Forgot {len(stale)} Spotify responses about {spotify_id}")
+
+
+def collect_metrics() -> List[str]:
+    sessions = {"spotify": spotify_session, "http": http_session}
+    stats = {name: session_stats(session) for name, session in sessions.items()}
+    lines = []
+    for key, type_, help_ in (
+        ("requests", "counter", "HTTP requests sent, including retries."),
+        ("throttled", "counter", "Responses that were 429 Too Many Requests."),
+        ("retries", "counter", "Requests retried after a 429 or 5xx."),
+        ("errors", "counter", "Requests that failed after every retry."),
+        ("wait_seconds", "counter", "Time spent waiting on the rate limiter and backoff."),
+    ):
+        name = f"jmm_http_{key}_total"
+        lines.extend(header(name, type_, help_))
+        lines.extend(sample(name, stats[session][key], session=session) for session in sessions)
+    limiter = spotify_session.get_adapter("https://").limiter
+    if limiter is not None:
+        lines.extend(header(
+            "jmm_spotify_rate_limit", "gauge", "Current Spotify requests per second."))
+        lines.append(sample("jmm_spotify_rate_limit", limiter.bucket.rate))
+    return lines
+
+
+register_collector(collect_metrics)
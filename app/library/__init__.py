@@ -0,0 +1,21 @@
+from .index import (
+    MISSING,
+    PARTIAL,
+    PRESENT,
+    LibraryIndex,
+    library_index,
+    summarize_status,
+)
+from .cover_art import CoverArtStore, cover_art, is_cover_url
+
+__all__ = [
+    "CoverArtStore",
+    "LibraryIndex",
+    "MISSING",
+    "PARTIAL",
+    "PRESENT",
+    "cover_art",
+    "is_cover_url",
+    "library_index",
+    "summarize_status",
+]
@@ -0,0 +1,196 @@
+from ..context import get_cover_art_concurrency, get_cover_art_max_age, get_data_dir
+from ..database import connect
+from ..http_client import http_session
+from ..files import atomic_open
+
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+
+__all__ = ["CoverArtStore", "cover_art", "is_cover_url"]
+
+logger = logging.getLogger("master")
+
+# Images are only fetched from Spotify's image CDNs, the thumbnail route
+# must not turn into an open proxy.
+COVER_HOST_SUFFIXES = (".scdn.co", ".spotifycdn.com")
+
+
+def is_cover_url(url: Optional[str]) -> bool:
+    if not url:
+        return False
+    parsed = urlparse(url)
+    return parsed.scheme == "https" and parsed.netloc.endswith(COVER_HOST_SUFFIXES)
+
+
+class CoverArtStore:
+    """
+    Local copies of cover art keyed by a hash of the image URL.
+
+    A stored image is reused as is for COVER_ART_MAX_AGE seconds, after that
+    it is revalidated with If-None-Match / If-Modified-Since so unchanged
+    images are not downloaded again. Concurrent requests for the same URL
+    share one fetch.
+    """
+
+    def __init__(self, db_name: str = "covers", directory: Optional[Path] = None):
+        self.db_name = db_name
+        self.directory = directory or get_data_dir().joinpath("covers")
+        self.connection = None
+        self.lock = threading.Lock()
+        self.fetching: Dict[str, Future] = {}
+        self.executor = ThreadPoolExecutor(
+            get_cover_art_concurrency(), thread_name_prefix="cover-art")
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = connect(self.db_name)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS covers (
+                    url_hash TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    content_type TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_at REAL NOT NULL
+                )
+                """
+            )
+        return self.connection
+
+    @staticmethod
+    def url_hash(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def path(self, url: str) -> Path:
+        return self.directory.joinpath(self.url_hash(url))
+
+    def content_type(self, url: str) -> str:
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT content_type FROM covers WHERE url_hash = ?",
+                (self.url_hash(url),),
+            ).fetchone()
+        return (row and row["content_type"]) or "image/jpeg"
+
+    def _fetch(self, url: str) -> Optional[Path]:
+        url_hash = self.url_hash(url)
+        path = self.path(url)
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM covers WHERE url_hash = ?", (url_hash,)
+            ).fetchone()
+        if row is not None and not path.exists():
+            row = None
+        if row is not None and time.time() - row["checked_at"] < get_cover_art_max_age():
+            return path
+
+        headers = {}
+        if row is not None:
+            if row["etag"]:
+                headers["If-None-Match"] = row["etag"]
+            if row["last_modified"]:
+                headers["If-Modified-Since"] = row["last_modified"]
+
+        try:
+            with http_session.get(url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 304:
+                    logger.debug(f"Cover art unchanged: {url}")
+                    etag, last_modified = row["etag"], row["last_modified"]
+                    content_type = row["content_type"]
+                else:
+                    response.raise_for_status()
+                    with atomic_open(path, "wb") as file:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            file.write(chunk)
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    content_type = response.headers.get("Content-Type")
+                    logger.debug(f"Cover art downloaded: {url}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error downloading cover art {url}: {e}")
+            # A stale copy is better than none.
+            return path if row is not None else None
+
+        with self.lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO covers "
+                "(url_hash, url, content_type, etag, last_modified, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url_hash, url, content_type, etag, last_modified, time.time()),
+            )
+        return path
+
+    def _submit(self, url: str) -> Future:
+        with self.lock:
+            future = self.fetching.get(url)
+            if future is None:
+                future = self.executor.submit(self._fetch, url)
+                self.fetching[url] = future
+                future.add_done_callback(lambda _: self._forget(url))
+        return future
+
+    def _forget(self, url: str):
+        with self.lock:
+            self.fetching.pop(url, None)
+
+    def prefetch(self, urls: Iterable[Optional[str]]):
+        """
+        Starts fetching the images in the background without waiting.
+        """
+        for url in dict.fromkeys(urls):
+            if is_cover_url(url):
+                self._submit(url)
+
+    def fetch(self, url: str) -> Optional[Path]:
+        """
+        Returns the path of the stored image, fetching or revalidating it
+        first if needed. Returns None if the image could not be fetched.
+        """
+        if not is_cover_url(url):
+            logger.debug(f"Not a cover art url: {url}")
+            return None
+        return self._submit(url).result()
+
+    def fetch_many(self, urls: Iterable[Optional[str]]) -> Dict[str, Optional[Path]]:
+        futures = {
+            url: self._submit(url) for url in dict.fromkeys(urls) if is_cover_url(url)
+        }
+        return {url: future.result() for url, future in futures.items()}
+
+    def copy_to(self, url: str, destination: Path) -> bool:
+        """
+        Places the image at destination, e.g. an album or playlist folder.jpg.
+        The file is left alone when it already matches the stored copy.
+        """
+        source = self.fetch(url)
+        if source is None:
+            return False
+        destination = Path(destination)
+        try:
+            source_stat = source.stat()
+            if destination.exists():
+                stat = destination.stat()
+                if stat.st_size == source_stat.st_size and stat.st_mtime >= source_stat.st_mtime:
+                    return True
+            with open(source, "rb") as source_file, \
+                    atomic_open(destination, "wb") as file:
+                shutil.copyfileobj(source_file, file)
+        except OSError as e:
+            logger.error(f"Failed to write cover art to {destination}: {e}")
+            return False
+        logger.debug(f"Cover art written to {destination}")
+        return True
+
+
+cover_art = CoverArtStore()
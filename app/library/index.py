@@ -0,0 +1,632 @@
+from spotdl.types.song import Song
+
+from tag_reader import SongTags, read_song_tags
+
+from .tags import AUDIO_EXTENSIONS, normalize_name, song_id_from_url
+from ..context import (
+    get_music_dir,
+    get_music_format,
+    get_library_format_policy,
+    get_library_rescan_interval,
+    get_library_scan_workers,
+)
+from ..database import connect
+
+import os
+import logging
+import threading
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+
+__all__ = [
+    "LibraryIndex",
+    "MISSING",
+    "PARTIAL",
+    "PRESENT",
+    "library_index",
+    "summarize_status",
+]
+
+logger = logging.getLogger("master")
+
+# Files are recorded in batches of this size while scanning, and fewer
+# files than this are read without starting worker processes.
+SCAN_BATCH_SIZE = 500
+# Files handed to a worker process at a time.
+SCAN_CHUNK_SIZE = 64
+
+PRESENT = "present"
+PARTIAL = "partial"
+MISSING = "missing"
+
+
+class FileEntry(NamedTuple):
+    song_id: str
+    album_id: Optional[str]
+    path: Path
+    bitrate: Optional[int] = None
+    album_name: Optional[str] = None
+    artist_name: Optional[str] = None
+
+
+def summarize_status(statuses: Iterable[str]) -> str:
+    """
+    Status of an album or playlist from the statuses of its songs.
+    """
+    statuses = set(statuses)
+    if statuses == {PRESENT}:
+        return PRESENT
+    return PARTIAL if PRESENT in statuses else MISSING
+
+
+class LibraryIndex:
+    """
+    On-disk index of the audio files in the music directory with their
+    Spotify song id, format and bitrate, so songs that already exist can be
+    dropped before spotdl searches for them.
+
+    A song may be stored in several formats. With the "any" format policy a
+    file in any format counts as present, so changing MUSIC_FORMAT does not
+    download the library again. With "exact" only files in the current
+    format count.
+
+    The index is fed by finished downloads and by scans of the music
+    directory. Scans read tags in worker processes, and after the first one
+    only look into directories whose mtime changed. A full scan reads every
+    file again.
+
+    The formats each song is stored in are also kept in memory, loaded on
+    first use and updated with every change, so views can show what is in
+    the library with a dict lookup per song.
+    """
+
+    def __init__(self, db_name: str = "library"):
+        self.db_name = db_name
+        self.connection = None
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.full_scan_requested = False
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # song id -> format -> number of files
+        self.song_formats: Optional[Dict[str, Dict[str, int]]] = None
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = connect(self.db_name)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    song_id TEXT NOT NULL,
+                    album_id TEXT,
+                    format TEXT NOT NULL,
+                    bitrate INTEGER,
+                    size INTEGER,
+                    mtime REAL,
+                    album_name TEXT,
+                    artist_name TEXT,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS dirs (
+                    path TEXT PRIMARY KEY,
+                    mtime REAL NOT NULL
+                )
+                """
+            )
+            self._migrate()
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_song_id ON files (song_id, format)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_album_id ON files (album_id)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_names ON files (artist_name, album_name)"
+            )
+        return self.connection
+
+    def _migrate(self):
+        # Earlier versions kept a single file per song in a songs table.
+        tables = {
+            row["name"] for row in self.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        if "songs" in tables:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO files (path, song_id, album_id, format, updated_at) "
+                "SELECT path, song_id, album_id, COALESCE(format, ''), updated_at FROM songs"
+            )
+            self.connection.execute("DROP TABLE songs")
+            logger.info("Migrated the library index to one row per file")
+
+        columns = {
+            row["name"]
+            for row in self.connection.execute("PRAGMA table_info(files)")
+        }
+        for column in ("album_name", "artist_name"):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE files ADD COLUMN {column} TEXT")
+
+    def _policy_clause(self) -> Tuple[str, Tuple[str, ...]]:
+        if get_library_format_policy() == "any":
+            return "", ()
+        return " AND format = ?", (get_music_format(),)
+
+    def _satisfies_policy(self, format_: str) -> bool:
+        return get_library_format_policy() == "any" or format_ == get_music_format()
+
+    def _song_formats(self) -> Dict[str, Dict[str, int]]:
+        # Called with the lock held.
+        if self.song_formats is None:
+            song_formats: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for row in self._connect().execute("SELECT song_id, format FROM files"):
+                formats = song_formats[row["song_id"]]
+                formats[row["format"]] = formats.get(row["format"], 0) + 1
+            self.song_formats = dict(song_formats)
+            logger.debug(f"Loaded {len(self.song_formats)} songs into memory")
+        return self.song_formats
+
+    def _count_files(self, rows: Iterable[Tuple[str, str]], delta: int):
+        # Called with the lock held, rows are (song id, format) pairs.
+        song_formats = self._song_formats()
+        for song_id, format_ in rows:
+            formats = song_formats.setdefault(song_id, {})
+            formats[format_] = formats.get(format_, 0) + delta
+            if formats[format_] <= 0:
+                del formats[format_]
+            if not formats:
+                del song_formats[song_id]
+
+    def _indexed_rows(self, paths: List[str]) -> List[Tuple[str, str]]:
+        # Called with the lock held.
+        rows = []
+        for i in range(0, len(paths), 500):
+            batch = paths[i:i + 500]
+            rows += [
+                (row["song_id"], row["format"]) for row in self._connect().execute(
+                    "SELECT song_id, format FROM files WHERE path IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                )
+            ]
+        return rows
+
+    def song_status(self, song_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        PRESENT or MISSING for each song id under the format policy, from
+        memory and without checking the files still exist.
+        """
+        any_format = get_library_format_policy() == "any"
+        music_format = get_music_format()
+        with self.lock:
+            song_formats = self._song_formats()
+            return {
+                song_id: PRESENT
+                if (formats := song_formats.get(song_id))
+                and (any_format or music_format in formats)
+                else MISSING
+                for song_id in song_ids
+            }
+
+    def record_many(self, entries: Iterable[FileEntry]):
+        rows = []
+        now = datetime.now().isoformat()
+        for entry in entries:
+            try:
+                stat = entry.path.stat()
+            except OSError:
+                continue
+            rows.append((
+                str(entry.path),
+                entry.song_id,
+                entry.album_id,
+                entry.path.suffix.lstrip(".").lower(),
+                entry.bitrate,
+                stat.st_size,
+                stat.st_mtime,
+                normalize_name(entry.album_name),
+                normalize_name(entry.artist_name),
+                now,
+            ))
+        with self.lock:
+            self._count_files(self._indexed_rows([row[0] for row in rows]), -1)
+            self._connect().executemany(
+                "INSERT INTO files (path, song_id, album_id, format, bitrate, size, "
+                "mtime, album_name, artist_name, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                "song_id = excluded.song_id, "
+                "album_id = COALESCE(excluded.album_id, files.album_id), "
+                "format = excluded.format, bitrate = excluded.bitrate, "
+                "size = excluded.size, mtime = excluded.mtime, "
+                "album_name = COALESCE(excluded.album_name, files.album_name), "
+                "artist_name = COALESCE(excluded.artist_name, files.artist_name), "
+                "updated_at = excluded.updated_at",
+                rows,
+            )
+            self._count_files(((row[1], row[3]) for row in rows), 1)
+
+    def record(self, entry: FileEntry):
+        self.record_many([entry])
+
+    def record_results(self, results: Iterable[Tuple[Song, Optional[Path]]]):
+        """
+        Records the (song, path) pairs returned by download_multiple_songs.
+        """
+        entries = []
+        for song, path in results:
+            if path is not None and Path(path).exists():
+                entries.append(FileEntry(
+                    song.song_id,
+                    song.album_id,
+                    Path(path),
+                    read_song_tags(Path(path)).bitrate,
+                    song.album_name,
+                    song.album_artist,
+                ))
+        self.record_many(entries)
+
+    def _files(self, song_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        files: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        with self.lock:
+            connection = self._connect()
+            # SQLite limits the number of bound parameters per statement.
+            for i in range(0, len(song_ids), 500):
+                batch = song_ids[i:i + 500]
+                rows = connection.execute(
+                    "SELECT * FROM files WHERE song_id IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for row in rows:
+                    files[row["song_id"]].append(dict(row))
+        return files
+
+    def _best(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # The current format first, then the highest bitrate.
+        music_format = get_music_format()
+        return max(
+            files, key=lambda file: (file["format"] == music_format, file["bitrate"] or 0))
+
+    def get(self, song_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The preferred file of a song, in the current format if there is one.
+        """
+        files = self._files([song_id]).get(song_id)
+        return self._best(files) if files else None
+
+    def formats(self, song_ids: List[str]) -> Dict[str, str]:
+        """
+        The format of the preferred file of each indexed song, without
+        checking the files still exist.
+        """
+        return {
+            song_id: self._best(files)["format"]
+            for song_id, files in self._files(song_ids).items()
+        }
+
+    def _forget(self, paths: Iterable[str]):
+        paths = list(paths)
+        with self.lock:
+            self._count_files(self._indexed_rows(paths), -1)
+            self._connect().executemany(
+                "DELETE FROM files WHERE path = ?", [(path,) for path in paths]
+            )
+
+    def missing_songs(self, songs: List[Song]) -> List[Song]:
+        """
+        Returns the songs without a file on disk that satisfies the format
+        policy. Index entries whose file has since been removed are dropped.
+        """
+        missing = self.missing_song_ids([song.song_id for song in songs])
+        return [song for song in songs if song.song_id in missing]
+
+    def missing_song_ids(self, song_ids: Iterable[str]) -> Set[str]:
+        """
+        Like missing_songs, for song ids.
+        """
+        song_ids = list(song_ids)
+        files = self._files(song_ids)
+        gone = []
+        present = set()
+        for song_id, song_files in files.items():
+            for file in song_files:
+                if not os.path.exists(file["path"]):
+                    gone.append(file["path"])
+                elif self._satisfies_policy(file["format"]):
+                    present.add(song_id)
+        if gone:
+            logger.debug(f"Forgetting {len(gone)} removed files")
+            self._forget(gone)
+        return set(song_ids) - present
+
+    def album_song_count(self, album_id: str) -> int:
+        clause, params = self._policy_clause()
+        with self.lock:
+            return self._connect().execute(
+                f"SELECT COUNT(DISTINCT song_id) FROM files WHERE album_id = ?{clause}",
+                (album_id, *params),
+            ).fetchone()[0]
+
+    def is_album_complete(self, album_id: str, tracks_count: int) -> bool:
+        return bool(tracks_count) and self.album_song_count(album_id) >= tracks_count
+
+    def album_song_counts(self, albums: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Number of songs in the library for each of the given Spotify album
+        objects, keyed by album id. Songs are matched by album id, or by the
+        album and album artist names for files only known from a scan.
+        """
+        clause, params = self._policy_clause()
+        counts = {}
+        with self.lock:
+            connection = self._connect()
+            for album in albums:
+                artist = album["artists"][0]["name"] if album.get("artists") else None
+                counts[album["id"]] = connection.execute(
+                    "SELECT COUNT(DISTINCT song_id) FROM files WHERE (album_id = ? "
+                    f"OR (artist_name = ? AND album_name = ?)){clause}",
+                    (album["id"], normalize_name(artist),
+                     normalize_name(album["name"]), *params),
+                ).fetchone()[0]
+        return counts
+
+    def find(
+        self,
+        song_id: Optional[str] = None,
+        album_id: Optional[str] = None,
+        artist: Optional[str] = None,
+        album: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """
+        Indexed files matching all of the given filters. Artist and album
+        names are matched case-insensitively against the album artist and
+        album name.
+        """
+        filters = {
+            "song_id": song_id,
+            "album_id": album_id,
+            "artist_name": normalize_name(artist),
+            "album_name": normalize_name(album),
+        }
+        filters = {column: value for column, value in filters.items() if value}
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1"
+        with self.lock:
+            rows = self._connect().execute(
+                f"SELECT * FROM files WHERE {where} "
+                "ORDER BY artist_name, album_name, path LIMIT ?",
+                (*filters.values(), limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            connection = self._connect()
+            formats = {
+                row["format"]: row["count"] for row in connection.execute(
+                    "SELECT format, COUNT(*) AS count FROM files GROUP BY format")
+            }
+            songs = connection.execute(
+                "SELECT COUNT(DISTINCT song_id) FROM files").fetchone()[0]
+            duplicated = connection.execute(
+                "SELECT COUNT(*) FROM (SELECT song_id FROM files "
+                "GROUP BY song_id HAVING COUNT(*) > 1)"
+            ).fetchone()[0]
+        return {
+            "files": sum(formats.values()),
+            "songs": songs,
+            "songs_in_several_files": duplicated,
+            "formats": formats,
+            "format_policy": get_library_format_policy(),
+        }
+
+    def duplicates(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Songs stored in more than one file, with every file of each.
+        """
+        with self.lock:
+            song_ids = [
+                row["song_id"] for row in self._connect().execute(
+                    "SELECT song_id FROM files GROUP BY song_id "
+                    "HAVING COUNT(*) > 1 ORDER BY song_id LIMIT ?",
+                    (limit,),
+                )
+            ]
+        files = self._files(song_ids)
+        return [{"song_id": song_id, "files": files[song_id]} for song_id in song_ids]
+
+    def _indexed_files(self, directory: str) -> Dict[str, Tuple[int, float]]:
+        """
+        Size and mtime of the indexed files directly inside a directory.
+        """
+        prefix = os.path.join(directory, "")
+        # Every path starting with the prefix sorts between these two, which
+        # lets SQLite use the primary key.
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT path, size, mtime FROM files WHERE path >= ? AND path < ?",
+                (prefix, upper),
+            ).fetchall()
+        return {
+            row["path"]: (row["size"], row["mtime"])
+            for row in rows if os.path.dirname(row["path"]) == directory
+        }
+
+    def _walk(
+        self, music_dir: Path, full: bool
+    ) -> Tuple[List[str], List[str], Dict[str, float], List[str]]:
+        """
+        Lists the music directory and returns the files to read, the indexed
+        files that are gone, the mtimes of the directories looked into and
+        the indexed directories that are gone. Files are only looked at in
+        directories whose mtime changed and only read when their size or
+        mtime differs from the index, unless full is set, which reads every
+        file.
+        """
+        with self.lock:
+            known_dirs = {
+                row["path"]: row["mtime"]
+                for row in self._connect().execute("SELECT path, mtime FROM dirs")
+            }
+
+        to_read: List[str] = []
+        gone: List[str] = []
+        dir_mtimes: Dict[str, float] = {}
+        seen = set()
+        stack = [str(music_dir)]
+        while stack:
+            directory = stack.pop()
+            seen.add(directory)
+            try:
+                mtime = os.stat(directory).st_mtime
+                with os.scandir(directory) as iterator:
+                    entries = list(iterator)
+            except OSError as e:
+                logger.error(f"Failed to list {directory}: {e}")
+                continue
+            stack.extend(
+                entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            if not full and known_dirs.get(directory) == mtime:
+                continue
+
+            indexed = self._indexed_files(directory)
+            for entry in entries:
+                if not entry.is_file() or \
+                        os.path.splitext(entry.name)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if indexed.pop(entry.path, None) != (stat.st_size, stat.st_mtime) or full:
+                    to_read.append(entry.path)
+            gone.extend(indexed)
+            dir_mtimes[directory] = mtime
+
+        removed_dirs = [directory for directory in known_dirs if directory not in seen]
+        for directory in removed_dirs:
+            gone.extend(self._indexed_files(directory))
+        return to_read, gone, dir_mtimes, removed_dirs
+
+    def _read_tags(self, paths: List[str]) -> Iterator[Tuple[str, SongTags]]:
+        if len(paths) < SCAN_BATCH_SIZE:
+            yield from zip(paths, map(read_song_tags, paths))
+            return
+        # Tag parsing is CPU bound Python, so it is spread over processes.
+        # Forking this process could copy a lock held by another thread, so
+        # workers are forked from a server process that only imports
+        # tag_reader, which does not import the app.
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([read_song_tags.__module__])
+        with ProcessPoolExecutor(get_library_scan_workers(), mp_context=context) as executor:
+            self.executor = executor
+            try:
+                yield from zip(
+                    paths, executor.map(read_song_tags, paths, chunksize=SCAN_CHUNK_SIZE))
+            except CancelledError:
+                # stop() dropped the files not read yet.
+                return
+            finally:
+                self.executor = None
+
+    def scan(self, music_dir: Optional[Path] = None, full: bool = False) -> int:
+        """
+        Brings the index up to date with the music directory: new and
+        changed files are read, removed ones are forgotten. Returns the
+        number of files recorded, or 0 if a scan is already running.
+        """
+        music_dir = music_dir or get_music_dir()
+        if not self.scan_lock.acquire(blocking=False):
+            logger.info("Library scan already running")
+            return 0
+        try:
+            to_read, gone, dir_mtimes, removed_dirs = self._walk(music_dir, full)
+            logger.info(
+                f"Library scan of {music_dir}: {len(dir_mtimes)} changed "
+                f"directories, {len(to_read)} files to read"
+            )
+
+            added = 0
+            batch: List[FileEntry] = []
+            for path, tags in self._read_tags(to_read):
+                song_id = song_id_from_url(tags.url) if tags.url else None
+                if song_id is None:
+                    continue
+                batch.append(FileEntry(
+                    song_id, None, Path(path), tags.bitrate, tags.album, tags.album_artist))
+                if len(batch) >= SCAN_BATCH_SIZE:
+                    self.record_many(batch)
+                    added += len(batch)
+                    batch = []
+            self.record_many(batch)
+            added += len(batch)
+            if self.stopping.is_set():
+                # The directories are left unsaved so the next scan reads
+                # the rest of their files.
+                logger.info(f"Library scan stopped after recording {added} files")
+                return added
+
+            if gone:
+                self._forget(gone)
+            with self.lock:
+                connection = self._connect()
+                connection.executemany(
+                    "DELETE FROM dirs WHERE path = ?", [(d,) for d in removed_dirs])
+                # Saved last, so an interrupted scan looks at the same
+                # directories again.
+                connection.executemany(
+                    "INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)",
+                    dir_mtimes.items(),
+                )
+            logger.info(
+                f"Library scan recorded {added} files and forgot {len(gone)}")
+            return added
+        finally:
+            self.scan_lock.release()
+
+    def request_scan(self, full: bool = False):
+        """
+        Asks the scanner thread to rescan now.
+        """
+        self.full_scan_requested = self.full_scan_requested or full
+        self.wakeup.set()
+
+    def _work(self):
+        full = False
+        while not self.stopping.is_set():
+            try:
+                self.scan(full=full)
+            except Exception as e:
+                logger.error(f"Library scan failed: {e}")
+            interval = get_library_rescan_interval()
+            self.wakeup.wait(timeout=interval or None)
+            self.wakeup.clear()
+            full, self.full_scan_requested = self.full_scan_requested, False
+
+    def start_scan(self):
+        self.stopping.clear()
+        threading.Thread(target=self._work, name="library-scan", daemon=True).start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        # Files not handed to a worker yet are dropped, so shutting down does
+        # not wait for a scan of the whole library.
+        executor = self.executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+library_index = LibraryIndex()
@@ -0,0 +1,18 @@
+from typing import Optional
+
+
+AUDIO_EXTENSIONS = {".mp3", ".m4a", ".flac", ".opus", ".ogg", ".wav"}
+
+
+def song_id_from_url(url: str) -> Optional[str]:
+    if "open.spotify.com/track/" not in url:
+        return None
+    return url.split("open.spotify.com/track/", 1)[1].split("?", 1)[0].strip("/")
+
+
+def normalize_name(name: Optional[str]) -> Optional[str]:
+    """
+    Album and artist names as they are compared between the library and
+    Spotify.
+    """
+    return name.casefold().strip() if name else None
@@ -0,0 +1,145 @@
+import copy
+import json
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Dict, List, Optional, Tuple
+
+
+__all__ = [
+    "JSONFormatter",
+    "SamplingFilter",
+    "level_for",
+    "parse_levels",
+    "start_listener",
+    "stop_listener",
+]
+
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """
+    Parses "spotdl=INFO,urllib3=WARNING" into logger names and levels.
+    """
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        assert level, f"Expected name=LEVEL in LOG_LEVELS, got {item!r}"
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+        assert isinstance(levels[name.strip()], int), f"Unknown log level {level!r}"
+    return levels
+
+
+def level_for(name: str, levels: Dict[str, int], default: int) -> int:
+    """
+    The level of the most specific configured ancestor of a logger, so
+    "spotdl" also covers "spotdl.download".
+    """
+    parts = name.split(".")
+    for i in range(len(parts), 0, -1):
+        level = levels.get(".".join(parts[:i]))
+        if level is not None:
+            return level
+    return default
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log collectors.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through at most per_second DEBUG records from each call site every
+    second. The number dropped is added to the next record let through from
+    that site. Higher levels always pass.
+    """
+
+    def __init__(self, per_second: int):
+        super().__init__()
+        self.per_second = per_second
+        # call site -> [second, records let through, records dropped]
+        self.windows: Dict[Tuple[str, int], List[int]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.per_second <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        second = int(record.created)
+        with self.lock:
+            window = self.windows.get(site)
+            if window is None or window[0] != second:
+                window = self.windows[site] = [second, 0, window[2] if window else 0]
+            if window[1] >= self.per_second:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is rendered on the calling thread since its arguments
+        # may change later, but the traceback is kept apart from it so the
+        # JSON output can still report it separately.
+        record = copy.copy(record)
+        message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = message, None, None
+        return record
+
+
+def start_listener(*handlers: logging.Handler) -> logging.Handler:
+    """
+    Starts a thread writing records to the given handlers and returns the
+    handler loggers should use instead, which only puts records on a queue.
+    """
+    global _listener
+    queue = SimpleQueue()
+    with _listener_lock:
+        assert _listener is None, "Log listener already started"
+        _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    atexit.register(stop_listener)
+    return _QueueHandler(queue)
+
+
+def stop_listener():
+    """
+    Writes out the records still queued and stops the listener thread.
+    """
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
@@ -0,0 +1,184 @@
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "header",
+    "register_collector",
+    "render",
+    "sample",
+]
+
+# Latency buckets in seconds, from a cached lookup up to a slow album.
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+logger = logging.getLogger("master")
+
+LabelValues = Tuple[str, ...]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], List[str]]] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def header(name: str, type_: str, help_: str) -> List[str]:
+    return [f"# HELP {name} {help_}", f"# TYPE {name} {type_}"]
+
+
+def sample(name: str, value: float, **labels: str) -> str:
+    return f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}"
+
+
+class _Metric(ABC):
+    type_ = ""
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        assert set(labels) == set(self.labelnames), \
+            f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def expose(self) -> List[str]:
+        """
+        Lines of the text exposition format for this metric.
+        """
+
+
+class Counter(_Metric):
+    type_ = "counter"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def expose(self) -> List[str]:
+        with self.lock:
+            values = dict(self.values)
+        lines = header(self.name, self.type_, self.help)
+        for key, value in sorted(values.items()):
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_ = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (count per bucket with +Inf last, sum)
+        self.values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def expose(self) -> List[str]:
+        with self.lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+        lines = header(self.name, self.type_, self.help)
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    """
+    Registers a callable returning exposition lines, for values that are
+    read from their owner at scrape time instead of being pushed.
+    """
+    with _registry_lock:
+        _collectors.append(collector)
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+    for collector in collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector {collector.__name__} failed: {e}")
+    return "\n".join(lines) + "\n"
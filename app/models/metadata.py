@@ -0,0 +1,331 @@
+from spotdl.types.song import Song
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..http_client import fresh_spotify, spotify
+
+import logging
+
+
+__all__ = [
+    "get_album_metadata",
+    "get_artist_album_ids",
+    "get_artist_albums_page",
+    "get_artist_metadata",
+    "get_artist_summary",
+    "get_playlist_metadata",
+    "get_playlist_snapshot_id",
+    "get_playlist_summary",
+    "get_playlist_tracks_page",
+    "get_track_metadata",
+]
+
+logger = logging.getLogger("master")
+
+# Maximum ids per request accepted by the bulk endpoints.
+ALBUMS_BATCH_SIZE = 20
+TRACKS_BATCH_SIZE = 50
+ARTISTS_BATCH_SIZE = 50
+
+# Page sizes of the lazily rendered views. Playlist pages match the size of
+# the first track page embedded in the playlist response.
+ARTIST_ALBUMS_PAGE_SIZE = 20
+PLAYLIST_TRACKS_PAGE_SIZE = 100
+
+
+def _batched(ids: Iterable[str], size: int) -> Iterable[List[str]]:
+    ids = list(dict.fromkeys(i for i in ids if i))
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _paginate(page: Dict[str, Any]) -> List[Dict[str, Any]]:
+    items = list(page["items"])
+    while page.get("next"):
+        page = spotify.next(page)
+        items.extend(page["items"])
+    return items
+
+
+def _with_all_tracks(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns a shallow copy of an album or playlist with every track page
+    merged into tracks.items. The responses cached by spotdl are not mutated.
+    """
+    return {**obj, "tracks": {**obj["tracks"], "items": _paginate(obj["tracks"])}}
+
+
+def _largest_image(images: List[Dict[str, Any]]) -> Optional[str]:
+    if not images:
+        return None
+    return max(
+        images, key=lambda image: (image.get("width") or 0) * (image.get("height") or 0)
+    )["url"]
+
+
+def fetch_albums(album_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetches full albums through the bulk endpoint, following the track pages
+    of albums with more than one page of tracks.
+    """
+    albums = {}
+    for batch in _batched(album_ids, ALBUMS_BATCH_SIZE):
+        for album in spotify.albums(batch)["albums"]:
+            if album is None:
+                continue
+            albums[album["id"]] = _with_all_tracks(album)
+    return albums
+
+
+def fetch_tracks(track_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    tracks = {}
+    for batch in _batched(track_ids, TRACKS_BATCH_SIZE):
+        for track in spotify.tracks(batch)["tracks"]:
+            if track is not None:
+                tracks[track["id"]] = track
+    return tracks
+
+
+def fetch_artists(artist_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    artists = {}
+    for batch in _batched(artist_ids, ARTISTS_BATCH_SIZE):
+        for artist in spotify.artists(batch)["artists"]:
+            if artist is not None:
+                artists[artist["id"]] = artist
+    return artists
+
+
+def song_from_track(
+    track: Dict[str, Any],
+    album: Dict[str, Any],
+    artist: Optional[Dict[str, Any]],
+) -> Song:
+    """
+    Mirrors spotdl's Song.from_url, using responses that were already fetched
+    instead of requesting the track, album and artist again.
+    """
+    return Song(
+        name=track["name"],
+        artists=[a["name"] for a in track["artists"]],
+        artist=track["artists"][0]["name"],
+        artist_id=track["artists"][0]["id"],
+        album_id=album["id"],
+        album_name=album["name"],
+        album_artist=album["artists"][0]["name"],
+        album_type=album["album_type"],
+        copyright_text=(
+            album["copyrights"][0]["text"] if album.get("copyrights") else None
+        ),
+        genres=album.get("genres", []) + (artist or {}).get("genres", []),
+        disc_number=track["disc_number"],
+        disc_count=max(
+            (t["disc_number"] for t in album["tracks"]["items"]), default=1
+        ),
+        duration=int(track["duration_ms"] / 1000),
+        year=int(album["release_date"][:4]),
+        date=album["release_date"],
+        track_number=track["track_number"],
+        tracks_count=album["total_tracks"],
+        isrc=track.get("external_ids", {}).get("isrc"),
+        song_id=track["id"],
+        explicit=track["explicit"],
+        publisher=album.get("label", ""),
+        url=track["external_urls"]["spotify"],
+        popularity=track.get("popularity"),
+        cover_url=_largest_image(album["images"]),
+    )
+
+
+def _album_songs(
+    albums: List[Dict[str, Any]],
+    tracks: Dict[str, Dict[str, Any]],
+    artists: Dict[str, Dict[str, Any]],
+) -> List[Song]:
+    songs = []
+    for album in albums:
+        for item in album["tracks"]["items"]:
+            track = tracks.get(item["id"])
+            if track is None or track.get("is_local"):
+                continue
+            songs.append(
+                song_from_track(track, album, artists.get(track["artists"][0]["id"]))
+            )
+    return songs
+
+
+def get_album_metadata(url: str) -> Tuple[Dict[str, Any], List[Song]]:
+    album = _with_all_tracks(spotify.album(url))
+    track_ids = [item["id"] for item in album["tracks"]["items"]]
+    tracks = fetch_tracks(track_ids)
+    artists = fetch_artists(t["artists"][0]["id"] for t in tracks.values())
+    songs = _album_songs([album], tracks, artists)
+
+    metadata = {
+        **album,
+        "name": album["name"],
+        "artist": album["artists"][0],
+        "url": album["external_urls"]["spotify"],
+    }
+    logger.debug(f"Fetched album {album['name']} with {len(songs)} songs")
+    return metadata, songs
+
+
+def get_artist_album_ids(url: str) -> List[str]:
+    """
+    Ids of an artist's albums and singles. Never cached, the subscription
+    scheduler compares it against the albums it already knows.
+    """
+    with fresh_spotify():
+        album_items = _paginate(
+            spotify.artist_albums(url, album_type="album,single", limit=50)
+        )
+
+    # Same deduplication as spotdl: one album per name.
+    known_names = set()
+    album_ids = []
+    for album in album_items:
+        name = album["name"].lower()
+        if name in known_names:
+            continue
+        known_names.add(name)
+        album_ids.append(album["id"])
+    return album_ids
+
+
+def get_artist_summary(url: str) -> Dict[str, Any]:
+    """
+    The artist alone, without albums or tracks, for the header of the view.
+    """
+    artist = spotify.artist(url)
+    return {**artist, "url": artist["external_urls"]["spotify"]}
+
+
+def get_artist_albums_page(url: str, page: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    One page of an artist's albums and singles as simplified album objects,
+    and the total number of them. Unlike get_artist_album_ids, duplicates are
+    only dropped within the page.
+    """
+    response = spotify.artist_albums(
+        url,
+        album_type="album,single",
+        limit=ARTIST_ALBUMS_PAGE_SIZE,
+        offset=(page - 1) * ARTIST_ALBUMS_PAGE_SIZE,
+    )
+    known_names = set()
+    albums = []
+    for album in response["items"]:
+        name = album["name"].lower()
+        if name in known_names:
+            continue
+        known_names.add(name)
+        albums.append(album)
+    return albums, response["total"]
+
+
+def get_artist_metadata(url: str) -> Tuple[Dict[str, Any], List[Song]]:
+    artist = spotify.artist(url)
+    album_ids = get_artist_album_ids(url)
+    albums = fetch_albums(album_ids)
+    ordered_albums = [albums[i] for i in album_ids if i in albums]
+    tracks = fetch_tracks(
+        item["id"] for album in ordered_albums for item in album["tracks"]["items"]
+    )
+    artists = {artist["id"]: artist}
+    artists.update(fetch_artists(
+        t["artists"][0]["id"]
+        for t in tracks.values()
+        if t["artists"][0]["id"] != artist["id"]
+    ))
+    songs = _album_songs(ordered_albums, tracks, artists)
+
+    metadata = {
+        **artist,
+        "name": artist["name"],
+        "genres": artist["genres"],
+        "url": artist["external_urls"]["spotify"],
+        "albums": [album["external_urls"]["spotify"] for album in ordered_albums],
+    }
+    logger.debug(
+        f"Fetched artist {artist['name']} with {len(ordered_albums)} albums "
+        f"and {len(songs)} songs"
+    )
+    return metadata, songs
+
+
+def get_playlist_metadata(url: str) -> Tuple[Dict[str, Any], List[Song]]:
+    playlist = _with_all_tracks(spotify.playlist(url))
+    # Playlists may also hold podcast episodes, which have no album.
+    items = [
+        item for item in playlist["tracks"]["items"]
+        if item.get("track") and item["track"].get("type") == "track"
+        and not item["track"].get("is_local") and item["track"].get("id")
+    ]
+
+    albums = fetch_albums(item["track"]["album"]["id"] for item in items)
+    artists = fetch_artists(item["track"]["artists"][0]["id"] for item in items)
+
+    songs = []
+    for position, item in enumerate(items, start=1):
+        track = item["track"]
+        album = albums.get(track["album"]["id"])
+        if album is None:
+            continue
+        song = song_from_track(track, album, artists.get(track["artists"][0]["id"]))
+        song.list_name = playlist["name"]
+        song.list_url = playlist["external_urls"]["spotify"]
+        song.list_position = position
+        song.list_length = len(items)
+        songs.append(song)
+
+    metadata = {
+        **playlist,
+        "name": playlist["name"],
+        "url": playlist["external_urls"]["spotify"],
+        "description": playlist.get("description") or "",
+        "author_url": playlist["owner"]["external_urls"]["spotify"],
+        "author_name": playlist["owner"].get("display_name") or "",
+        "cover_url": _largest_image(playlist["images"]) or "",
+    }
+    logger.debug(f"Fetched playlist {playlist['name']} with {len(songs)} songs")
+    return metadata, songs
+
+
+def get_playlist_summary(url: str) -> Dict[str, Any]:
+    """
+    The playlist with only the first page of tracks embedded in the response,
+    for the header and first rows of the view.
+    """
+    playlist = spotify.playlist(url)
+    return {
+        **playlist,
+        "url": playlist["external_urls"]["spotify"],
+        "author_name": playlist["owner"].get("display_name") or "",
+    }
+
+
+def get_playlist_tracks_page(url: str, page: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    One page of playlist items and the total number of items.
+    """
+    response = spotify.playlist_items(
+        url,
+        limit=PLAYLIST_TRACKS_PAGE_SIZE,
+        offset=(page - 1) * PLAYLIST_TRACKS_PAGE_SIZE,
+    )
+    return response["items"], response["total"]
+
+
+def get_playlist_snapshot_id(url: str) -> str:
+    """
+    Fetches only the snapshot id, which changes whenever the playlist does.
+    Never cached, it is what tells a sync whether anything changed.
+    """
+    with fresh_spotify():
+        return spotify.playlist(url, fields="snapshot_id")["snapshot_id"]
+
+
+def get_track_metadata(url: str) -> Tuple[Dict[str, Any], Song]:
+    track = spotify.track(url)
+    album = _with_all_tracks(spotify.album(track["album"]["id"]))
+    artist = spotify.artist(track["artists"][0]["id"])
+    return track, song_from_track(track, album, artist)
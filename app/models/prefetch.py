@@ -0,0 +1,125 @@
+from .spotify_types import Album, Artist
+from ..cache import metadata_cache
+from ..ratelimit import TokenBucket
+from ..context import (
+    get_prefetch_concurrency,
+    get_prefetch_limit,
+    get_prefetch_per_minute,
+)
+
+import logging
+import threading
+from collections import deque
+from typing import Deque, Iterable, List, Optional, Set, Tuple
+
+
+__all__ = ["Prefetcher", "prefetcher"]
+
+logger = logging.getLogger("master")
+
+# Links waiting to be warmed. When full the oldest are dropped, they belong
+# to views the user has most likely moved on from.
+PENDING_SIZE = 64
+
+Link = Tuple[str, str]
+
+
+class Prefetcher:
+    """
+    Warms the metadata cache with the albums and artists linked from a view
+    that was just rendered, so following a link is answered from cache.
+
+    Only the first PREFETCH_LIMIT links of a view are considered. They are
+    fetched by PREFETCH_CONCURRENCY threads, each fetch takes a token from a
+    PREFETCH_PER_MINUTE budget, and the most recent view is served first.
+    """
+
+    def __init__(self):
+        self.pending: Deque[Link] = deque(maxlen=PENDING_SIZE)
+        self.queued: Set[Link] = set()
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.threads: List[threading.Thread] = []
+        self.budget = TokenBucket(get_prefetch_per_minute() / 60)
+
+    @staticmethod
+    def is_cached(type_: str, url: str) -> bool:
+        if type_ == "album":
+            return ("album", url) in metadata_cache
+        return ("artist_summary", url) in metadata_cache and \
+            ("artist_albums_page", url, 1) in metadata_cache
+
+    def submit(self, links: Iterable[Link]):
+        """
+        Queues the linked (type, url) pairs of a view, in display order.
+        Does nothing unless the prefetcher was started.
+        """
+        if not self.threads:
+            return
+        links = [
+            link for link in dict.fromkeys(links) if not self.is_cached(*link)
+        ][:get_prefetch_limit()]
+        with self.condition:
+            # Pushed in reverse so the first link of the view is popped first.
+            for link in reversed(links):
+                if link in self.queued:
+                    continue
+                if len(self.pending) == self.pending.maxlen:
+                    self.queued.discard(self.pending.popleft())
+                self.pending.append(link)
+                self.queued.add(link)
+            self.condition.notify_all()
+
+    def _next(self) -> Optional[Link]:
+        with self.condition:
+            while not self.pending and not self.stopping.is_set():
+                self.condition.wait()
+            if self.stopping.is_set():
+                return None
+            link = self.pending.pop()
+            self.queued.discard(link)
+            return link
+
+    def _warm(self, type_: str, url: str):
+        if type_ == "album":
+            Album.get_metadata(url)
+        else:
+            Artist.get_summary(url)
+            Artist.get_albums_page(url, 1)
+
+    def _work(self):
+        while not self.stopping.is_set():
+            link = self._next()
+            if link is None:
+                return
+            # A link may have been opened while it was waiting.
+            if self.is_cached(*link):
+                continue
+            self.budget.acquire()
+            try:
+                self._warm(*link)
+                logger.debug(f"Prefetched {link[0]} {link[1]}")
+            except Exception as e:
+                logger.error(f"Prefetch failed for {link[1]}: {e}")
+
+    def start(self):
+        self.stopping.clear()
+        concurrency = get_prefetch_concurrency()
+        for i in range(concurrency):
+            thread = threading.Thread(
+                target=self._work, name=f"prefetch-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Started {concurrency} prefetch thread(s)")
+
+    def stop(self):
+        self.stopping.set()
+        with self.condition:
+            self.pending.clear()
+            self.queued.clear()
+            self.condition.notify_all()
+        self.threads.clear()
+
+
+prefetcher = Prefetcher()
@@ -1,6 +1,19 @@
 from ..context import logger
+from ..cache import metadata_cache
+from .metadata import (
+    get_album_metadata,
+    get_artist_album_ids,
+    get_artist_albums_page,
+    get_artist_metadata,
+    get_artist_summary,
+    get_playlist_metadata,
+    get_playlist_snapshot_id,
+    get_playlist_summary,
+    get_playlist_tracks_page,
+    get_track_metadata,
+)
 from typing import Any, Dict, List, Tuple
-from spotdl import SpotifyClient
+from dataclasses import fields
 from spotdl.types.album import Album as Album_
 from spotdl.types.artist import Artist as Artist_
 from spotdl.types.playlist import Playlist as Playlist_
@@ -9,37 +22,93 @@ from spotdl.types.song import Song
 __all__ = ["Album", "Artist", "Playlist", "Track"]
 
 
-spotify = SpotifyClient()
+def _from_metadata(cls, metadata: Dict[str, Any], songs: List[Song]):
+    """
+    Builds a spotdl song list from cached metadata. Only the dataclass fields
+    are passed on since the metadata also holds the raw Spotify payload, and
+    the songs are copied so downloads can't modify cached entries.
+    """
+    songs = [Song(**song.__dict__) for song in songs]
+    kwargs = {
+        field.name: metadata[field.name]
+        for field in fields(cls)
+        if field.name in metadata and field.name not in ("songs", "urls")
+    }
+    return cls(**kwargs, songs=songs, urls=[song.url for song in songs])
 
 
 class Album(Album_):
     @staticmethod
+    @metadata_cache.cached("album")
     def get_metadata(url: str) -> Tuple[Dict[str, Any], List[Song]]:
-        metadata, songs = Album_.get_metadata(url)
-        metadata.update(spotify.album(url))
-        return metadata, songs
+        return get_album_metadata(url)
+
+    @classmethod
+    def from_url(cls, url: str, fetch_songs: bool = True) -> "Album":
+        metadata, songs = cls.get_metadata(url)
+        return _from_metadata(cls, metadata, songs)
 
 
 class Artist(Artist_):
     @staticmethod
+    @metadata_cache.cached("artist")
     def get_metadata(url: str) -> Tuple[Dict[str, Any], List[Song]]:
-        metadata, songs = Artist_.get_metadata(url)
-        metadata.update(spotify.artist(url))
-        return metadata, songs
+        return get_artist_metadata(url)
+
+    @staticmethod
+    def get_album_ids(url: str) -> List[str]:
+        return get_artist_album_ids(url)
+
+    @staticmethod
+    @metadata_cache.cached("artist_summary")
+    def get_summary(url: str) -> Dict[str, Any]:
+        return get_artist_summary(url)
+
+    @staticmethod
+    @metadata_cache.cached("artist_albums_page")
+    def get_albums_page(url: str, page: int) -> Tuple[List[Dict[str, Any]], int]:
+        return get_artist_albums_page(url, page)
+
+    @classmethod
+    def from_url(cls, url: str, fetch_songs: bool = True) -> "Artist":
+        metadata, songs = cls.get_metadata(url)
+        return _from_metadata(cls, metadata, songs)
 
 
 class Playlist(Playlist_):
     @staticmethod
+    @metadata_cache.cached("playlist")
     def get_metadata(url: str):
-        metadata, songs = Playlist_.get_metadata(url)
-        metadata.update(spotify.playlist(url))
+        metadata, songs = get_playlist_metadata(url)
         unique_song_ids = set(song.song_id for song in songs)
         return metadata, songs, unique_song_ids
 
+    @staticmethod
+    def get_snapshot_id(url: str) -> str:
+        return get_playlist_snapshot_id(url)
+
+    @staticmethod
+    @metadata_cache.cached("playlist_summary")
+    def get_summary(url: str) -> Dict[str, Any]:
+        return get_playlist_summary(url)
+
+    @staticmethod
+    @metadata_cache.cached("playlist_tracks_page")
+    def get_tracks_page(url: str, snapshot_id: str, page: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Pages are cached per snapshot so a changed playlist never mixes pages
+        of two versions.
+        """
+        return get_playlist_tracks_page(url, page)
+
+    @classmethod
+    def from_url(cls, url: str, fetch_songs: bool = True) -> "Playlist":
+        metadata, songs, _ = cls.get_metadata(url)
+        return _from_metadata(cls, metadata, songs)
+
 
 class Track(Song):
     @staticmethod
-    def get_metadata(url): 
-        song = Song.from_url(url)
-        metadata = spotify.track(url)
-        return metadata, song
\ No newline at end of file
+    @metadata_cache.cached("track")
+    def get_metadata(url):
+        return get_track_metadata(url)
@@ -0,0 +1,51 @@
+import time
+import threading
+from typing import Optional
+
+
+__all__ = ["TokenBucket"]
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilling at `rate` tokens per second up to
+    `capacity` tokens.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        assert rate > 0, "rate should be positive"
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Blocks until the tokens are available and returns the seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, BackgroundTasks, Query, Request, Form
+from fastapi import APIRouter, Query, Request, Form
 from ..controllers.api import controller
 from typing import Optional
 
@@ -12,11 +12,101 @@ async def query(request: Request, url: str = Query(..., description="The search
     return await controller.query(url, request)
 
 
+@router.get("/query/albums")
+async def query_albums(request: Request, artist: str = Query(..., description="The artist URL"), page: int = Query(1, ge=1)):
+    return await controller.query_albums(artist, page, request)
+
+
+@router.get("/query/tracks")
+async def query_tracks(request: Request, playlist: str = Query(..., description="The playlist URL"), snapshot_id: str = Query(..., description="Snapshot the pages belong to"), page: int = Query(1, ge=1)):
+    return await controller.query_tracks(playlist, snapshot_id, page, request)
+
+
 @router.post("/download/")
-async def download(request: Request, background_tasks: BackgroundTasks, url: str = Query(..., description="The Download URL")):
-    return await controller.download(url, request, background_tasks)
+async def download(request: Request, url: str = Query(..., description="The Download URL"), priority: int = Query(0, description="Higher runs first")):
+    return await controller.download(url, request, priority)
+
+
+@router.get("/progress/stream")
+async def progress_stream(request: Request):
+    return await controller.progress_stream(request)
+
+
+@router.post("/download/bulk")
+async def download_bulk(request: Request, priority: int = Query(0, description="Higher runs first")):
+    return await controller.download_bulk(request, priority)
+
+
+@router.get("/jobs/")
+async def jobs():
+    return await controller.jobs()
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    return await controller.cancel_job(job_id)
+
+
+@router.post("/jobs/{job_id}/pause")
+async def pause_job(job_id: int):
+    return await controller.pause_job(job_id)
+
+
+@router.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: int):
+    return await controller.resume_job(job_id)
+
+
+@router.get("/library/")
+async def library():
+    return await controller.library()
+
+
+@router.get("/library/duplicates")
+async def library_duplicates(limit: int = Query(100, ge=1, le=1000)):
+    return await controller.library_duplicates(limit)
+
+
+@router.get("/library/files")
+async def library_files(song_id: Optional[str] = Query(None, description="Spotify song id"), album_id: Optional[str] = Query(None, description="Spotify album id"), artist: Optional[str] = Query(None, description="Album artist name"), album: Optional[str] = Query(None, description="Album name"), limit: int = Query(100, ge=1, le=1000)):
+    return await controller.library_files(song_id, album_id, artist, album, limit)
+
+
+@router.post("/library/scan")
+async def library_scan(full: bool = Query(False, description="Re-read every file")):
+    return await controller.library_scan(full)
+
+
+@router.get("/covers/")
+async def cover(url: str = Query(..., description="Spotify image URL")):
+    return await controller.cover(url)
+
+
+@router.get("/metrics")
+async def metrics():
+    return await controller.metrics()
 
 
 @router.get("/progress/")
 async def progress(request: Request, url: Optional[str] = Query(None, description="The search query")):
     return await controller.progress(url, request)
+
+
+@router.get("/subscriptions/")
+async def subscriptions():
+    return await controller.subscriptions()
+
+
+@router.post("/subscriptions/")
+async def subscribe(url: str = Query(..., description="Artist or playlist URL"), interval: Optional[float] = Query(None, description="Seconds between checks"), backfill: bool = Query(False, description="Download existing albums of an artist")):
+    return await controller.subscribe(url, interval, backfill)
+
+
+@router.delete("/subscriptions/{subscription_id}")
+async def unsubscribe(subscription_id: int):
+    return await controller.unsubscribe(subscription_id)
+
+
+@router.post("/subscriptions/{subscription_id}/run")
+async def run_subscription(subscription_id: int):
+    return await controller.run_subscription(subscription_id)
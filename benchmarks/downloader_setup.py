@@ -0,0 +1,60 @@
+"""
+Measures the per-album setup cost of a fresh spotdl downloader against one
+taken from the downloader pool.
+
+Needs the same environment as the app (.env with Spotify credentials,
+ffmpeg on the path). Nothing is downloaded.
+
+    python -m benchmarks.downloader_setup --albums 20
+"""
+from app.download.downloader_pool import DownloaderPool, create_downloader
+from app.context import get_music_format
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+
+def fresh(albums: int, album_dir: Path) -> float:
+    start = time.perf_counter()
+    for i in range(albums):
+        downloader = create_downloader(get_music_format())
+        downloader.settings["output"] = str(album_dir.joinpath(
+            "{track-number} - {title}.{output-ext}"))
+        downloader.settings["save_file"] = str(album_dir.joinpath(f"{i}.spotdl"))
+    return time.perf_counter() - start
+
+
+def pooled(albums: int, album_dir: Path) -> float:
+    pool = DownloaderPool()
+    start = time.perf_counter()
+    for i in range(albums):
+        with pool.acquire(
+            output=str(album_dir.joinpath("{track-number} - {title}.{output-ext}")),
+            save_file=album_dir.joinpath(f"{i}.spotdl"),
+            update_callback=lambda tracker, status: None,
+        ):
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--albums", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        album_dir = Path(tmp)
+        fresh_time = fresh(args.albums, album_dir)
+        pooled_time = pooled(args.albums, album_dir)
+
+    print(f"albums:            {args.albums}")
+    print(f"fresh downloader:  {fresh_time / args.albums * 1000:8.1f} ms/album")
+    print(f"pooled downloader: {pooled_time / args.albums * 1000:8.1f} ms/album")
+    print(f"saved per album:   "
+          f"{(fresh_time - pooled_time) / args.albums * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Local stand-ins for the services a download touches, used by the pipeline
+benchmark: a synthetic catalog served through a fake Spotify Web API, and
+a fake audio provider that downloads generated WAV files from the same
+server instead of searching YouTube Music and running yt-dlp.
+"""
+import io
+import json
+import math
+import time
+import wave
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+from pathlib import Path
+
+
+def spotify_id(kind: str, n: int) -> str:
+    # Same length as real ids so nothing downstream trips over them.
+    return f"{kind}{n:0{22 - len(kind)}d}"
+
+
+def synthetic_wav(seconds: float, sample_rate: int = 22050) -> bytes:
+    frames = int(seconds * sample_rate)
+    tone = struct.pack(
+        f"<{sample_rate}h",
+        *(int(8000 * math.sin(2 * math.pi * 440 * i / sample_rate))
+          for i in range(sample_rate)),
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        full, rest = divmod(frames, sample_rate)
+        wav.writeframes(tone * full + tone[:rest * 2])
+    return buffer.getvalue()
+
+
+class Catalog:
+    """
+    Deterministic artists, albums, tracks and playlists shaped like the
+    Spotify Web API responses the metadata layer and spotdl read.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        artists: int = 4,
+        albums_per_artist: int = 10,
+        tracks_per_album: int = 12,
+        playlist_tracks: int = 100,
+    ):
+        self.base_url = base_url
+        self.artists: Dict[str, Dict[str, Any]] = {}
+        self.albums: Dict[str, Dict[str, Any]] = {}
+        self.tracks: Dict[str, Dict[str, Any]] = {}
+        self.artist_albums: Dict[str, List[str]] = {}
+        self.playlists: Dict[str, Dict[str, Any]] = {}
+
+        album_n = track_n = 0
+        for a in range(artists):
+            artist_id = spotify_id("artist", a)
+            self.artists[artist_id] = {
+                "id": artist_id,
+                "name": f"Benchmark Artist {a}",
+                "genres": ["benchmark"],
+                "popularity": 50,
+                "followers": {"total": 1000 + a},
+                "images": self.images(artist_id),
+                "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+            }
+            self.artist_albums[artist_id] = []
+            for _ in range(albums_per_artist):
+                album_id = spotify_id("album", album_n)
+                album_n += 1
+                self.artist_albums[artist_id].append(album_id)
+                track_ids = []
+                for t in range(tracks_per_album):
+                    track_id = spotify_id("track", track_n)
+                    track_n += 1
+                    track_ids.append(track_id)
+                    self.tracks[track_id] = {
+                        "id": track_id,
+                        "name": f"Track {track_n}",
+                        "artists": [self.simple_artist(artist_id)],
+                        "disc_number": 1,
+                        "track_number": t + 1,
+                        "duration_ms": 30000,
+                        "explicit": False,
+                        "is_local": False,
+                        "popularity": 10,
+                        "external_ids": {"isrc": f"BENCH{track_n:07d}"},
+                        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+                        "album_id": album_id,
+                    }
+                self.albums[album_id] = {
+                    "id": album_id,
+                    "name": f"Album {album_n}",
+                    "album_type": "album",
+                    "artists": [self.simple_artist(artist_id)],
+                    "copyrights": [{"text": "Benchmark"}],
+                    "genres": [],
+                    "label": "Benchmark Records",
+                    "release_date": "2020-01-01",
+                    "total_tracks": tracks_per_album,
+                    "images": self.images(album_id),
+                    "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+                    "track_ids": track_ids,
+                }
+
+        # The playlist mixes tracks of the last artist's albums, which the
+        # album and artist workloads don't touch.
+        last_artist = spotify_id("artist", artists - 1)
+        pool = [
+            track_id
+            for album_id in self.artist_albums[last_artist]
+            for track_id in self.albums[album_id]["track_ids"]
+        ]
+        playlist_id = spotify_id("playlist", 0)
+        self.playlists[playlist_id] = {
+            "id": playlist_id,
+            "name": "Benchmark Playlist",
+            "description": "Synthetic playlist",
+            "snapshot_id": "snapshot-0",
+            "owner": {
+                "display_name": "benchmark",
+                "external_urls": {"spotify": "https://open.spotify.com/user/benchmark"},
+            },
+            "images": self.images(playlist_id),
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+            "track_ids": pool[:playlist_tracks],
+        }
+
+    def images(self, id_: str) -> List[Dict[str, Any]]:
+        return [{"url": f"{self.base_url}/images/{id_}.jpg", "width": 640, "height": 640}]
+
+    def simple_artist(self, artist_id: str) -> Dict[str, Any]:
+        artist = self.artists[artist_id]
+        return {key: artist[key] for key in ("id", "name", "external_urls")}
+
+    def simple_album(self, album_id: str) -> Dict[str, Any]:
+        album = self.albums[album_id]
+        return {key: value for key, value in album.items() if key != "track_ids"}
+
+    def track(self, track_id: str) -> Dict[str, Any]:
+        track = dict(self.tracks[track_id])
+        track["album"] = self.simple_album(track.pop("album_id"))
+        return track
+
+    def page(self, items: List[Any], path: str, offset: int, limit: int) -> Dict[str, Any]:
+        end = offset + limit
+        return {
+            "items": items[offset:end],
+            "total": len(items),
+            "limit": limit,
+            "offset": offset,
+            "next": f"{self.base_url}/v1/{path}?offset={end}&limit={limit}"
+            if end < len(items) else None,
+        }
+
+    def album(self, album_id: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        album = self.simple_album(album_id)
+        items = [
+            {key: value for key, value in self.tracks[i].items() if key != "album_id"}
+            for i in self.albums[album_id]["track_ids"]
+        ]
+        album["tracks"] = self.page(items, f"albums/{album_id}/tracks", offset, limit)
+        return album
+
+    def playlist_items(self, playlist_id: str, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+        items = [
+            {"added_at": "2024-01-01T00:00:00Z", "track": self.track(i)}
+            for i in self.playlists[playlist_id]["track_ids"]
+        ]
+        return self.page(items, f"playlists/{playlist_id}/tracks", offset, limit)
+
+    def route(self, path: str, query: Dict[str, str]) -> Optional[Any]:
+        parts = [part for part in path.split("/") if part][1:]  # drop "v1"
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", 50))
+        ids = query.get("ids", "").split(",") if "ids" in query else None
+        match parts:
+            case ["albums"] if ids:
+                return {"albums": [self.album(i) if i in self.albums else None for i in ids]}
+            case ["albums", album_id] if album_id in self.albums:
+                return self.album(album_id)
+            case ["albums", album_id, "tracks"] if album_id in self.albums:
+                return self.album(album_id, offset, limit)["tracks"]
+            case ["tracks"] if ids:
+                return {"tracks": [self.track(i) if i in self.tracks else None for i in ids]}
+            case ["tracks", track_id] if track_id in self.tracks:
+                return self.track(track_id)
+            case ["artists"] if ids:
+                return {"artists": [self.artists.get(i) for i in ids]}
+            case ["artists", artist_id] if artist_id in self.artists:
+                return self.artists[artist_id]
+            case ["artists", artist_id, "albums"] if artist_id in self.artists:
+                albums = [self.simple_album(i) for i in self.artist_albums[artist_id]]
+                return self.page(albums, f"artists/{artist_id}/albums", offset, limit)
+            case ["playlists", playlist_id] if playlist_id in self.playlists:
+                playlist = {
+                    key: value for key, value in self.playlists[playlist_id].items()
+                    if key != "track_ids"
+                }
+                if query.get("fields") == "snapshot_id":
+                    return {"snapshot_id": playlist["snapshot_id"]}
+                playlist["tracks"] = self.playlist_items(playlist_id)
+                return playlist
+            case ["playlists", playlist_id, "tracks"] if playlist_id in self.playlists:
+                return self.playlist_items(playlist_id, offset, int(query.get("limit", 100)))
+        return None
+
+
+class FakeServer:
+    """
+    Serves the catalog under /v1, generated audio under /audio and
+    placeholder cover art under /images, each with a configurable latency.
+    """
+
+    def __init__(
+        self,
+        api_latency: float = 0.05,
+        fetch_latency: float = 0.2,
+        audio_seconds: float = 30,
+        **catalog_options,
+    ):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.catalog = Catalog(self.base_url, **catalog_options)
+        self.api_latency = api_latency
+        self.fetch_latency = fetch_latency
+        self.audio = synthetic_wav(audio_seconds)
+        self.image = b"\xff\xd8\xff\xe0" + bytes(2048) + b"\xff\xd9"
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                parsed = urlparse(self.path)
+                if parsed.path.startswith("/audio/"):
+                    time.sleep(server.fetch_latency)
+                    return self.send(200, server.audio, "audio/wav")
+                if parsed.path.startswith("/images/"):
+                    return self.send(200, server.image, "image/jpeg")
+
+                time.sleep(server.api_latency)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                body = server.catalog.route(parsed.path, query)
+                if body is None:
+                    return self.send(
+                        404, b'{"error": {"status": 404, "message": "not found"}}',
+                        "application/json")
+                self.send(200, json.dumps(body).encode("utf-8"), "application/json")
+
+        return Handler
+
+    def start(self):
+        threading.Thread(
+            target=self.httpd.serve_forever, name="fake-server", daemon=True
+        ).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+class _AudioHandler:
+    """
+    The part of yt-dlp's YoutubeDL the downloader touches on the provider.
+    """
+
+    def add_progress_hook(self, hook):
+        pass
+
+
+class FakeAudioProvider:
+    """
+    Replaces spotdl's AudioProvider: the "download url" returned by the fake
+    search points at the fake server, and fetching it writes the WAV to
+    spotdl's temp folder the way yt-dlp would.
+    """
+
+    temp_folder: Path
+
+    def __init__(self, *args, **kwargs):
+        self.audio_handler = _AudioHandler()
+
+    def get_download_metadata(self, url: str, download: bool = False) -> Dict[str, Any]:
+        song_id = url.rstrip("/").rsplit("/", 1)[-1]
+        with urlopen(url, timeout=30) as response:
+            self.temp_folder.joinpath(f"{song_id}.wav").write_bytes(response.read())
+        return {"id": song_id, "ext": "wav", "abr": 128, "url": url}
@@ -0,0 +1,95 @@
+"""
+Counts the Spotify HTTP requests needed to build the view metadata and song
+list for each entity type, comparing spotdl's get_metadata plus the extra raw
+lookup (the previous wrappers) with the batched metadata layer.
+
+Needs the same environment as the app (.env with Spotify credentials).
+
+    python -m benchmarks.metadata_requests \\
+        --album https://open.spotify.com/album/... \\
+        --artist https://open.spotify.com/artist/... \\
+        --playlist https://open.spotify.com/playlist/... \\
+        --track https://open.spotify.com/track/...
+"""
+from app.models import metadata
+from spotdl import SpotifyClient
+from spotdl.types.song import Song
+from spotdl.types.album import Album as Album_
+from spotdl.types.artist import Artist as Artist_
+from spotdl.types.playlist import Playlist as Playlist_
+
+import argparse
+from typing import Callable
+
+
+spotify = SpotifyClient()
+
+
+def previous_album(url):
+    metadata_, songs = Album_.get_metadata(url)
+    metadata_.update(spotify.album(url))
+
+
+def previous_artist(url):
+    metadata_, songs = Artist_.get_metadata(url)
+    metadata_.update(spotify.artist(url))
+    Artist_.from_url(url).songs
+
+
+def previous_playlist(url):
+    metadata_, songs = Playlist_.get_metadata(url)
+    metadata_.update(spotify.playlist(url))
+
+
+def previous_track(url):
+    Song.from_url(url)
+    spotify.track(url)
+
+
+CASES = {
+    "album": (previous_album, metadata.get_album_metadata),
+    "artist": (previous_artist, metadata.get_artist_metadata),
+    "playlist": (previous_playlist, metadata.get_playlist_metadata),
+    "track": (previous_track, metadata.get_track_metadata),
+}
+
+
+def count_requests(func: Callable[[str], object], url: str) -> int:
+    """
+    Counts requests that actually reach Spotify, spotdl's response cache is
+    emptied first so both paths start cold.
+    """
+    spotify.cache.clear()
+    internal_call = spotify._internal_call
+    count = 0
+
+    def counting_call(*args, **kwargs):
+        nonlocal count
+        count += 1
+        return internal_call(*args, **kwargs)
+
+    spotify._internal_call = counting_call
+    try:
+        func(url)
+    finally:
+        spotify._internal_call = internal_call
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    for type_ in CASES:
+        parser.add_argument(f"--{type_}", action="append", default=[])
+    args = parser.parse_args()
+
+    print(f"{'type':<10}{'previous':>10}{'batched':>10}  url")
+    for type_, (previous, batched) in CASES.items():
+        for url in getattr(args, type_):
+            print(
+                f"{type_:<10}{count_requests(previous, url):>10}"
+                f"{count_requests(batched, url):>10}  {url}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Times the path generation done for every song of a playlist file: the
+previous clean() and per-song directory resolution against the translation
+table, the clean() cache and song_paths.
+
+Needs the same environment as the app (.env with Spotify credentials).
+Nothing is written or downloaded.
+
+    python -m benchmarks.path_generation --songs 10000 --albums 800
+"""
+from app.context import BAD_CHARS, clean, get_host_music_dir, get_music_format, _clean
+from app.download.download import album_dir_name, get_host_album_dir, song_paths
+
+import argparse
+import random
+import string
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, List
+
+
+def previous_clean(s: str) -> str:
+    return "".join(c for c in s if c not in [chr(i) for i in BAD_CHARS])
+
+
+def previous_paths(songs: List[SimpleNamespace]) -> List[str]:
+    paths = []
+    for song in songs:
+        album_dir = get_host_music_dir().joinpath(
+            f"{previous_clean(song.artist)} - {previous_clean(song.album_name)}"
+        ).absolute()
+        paths.append(str(album_dir.joinpath(
+            f"{song.track_number} - {previous_clean(song.name)}.{get_music_format()}")))
+    return paths
+
+
+def current_paths(songs: List[SimpleNamespace]) -> List[str]:
+    return [path for _, path in song_paths(songs, get_host_album_dir)]
+
+
+def synthetic_playlist(songs: int, albums: int) -> List[SimpleNamespace]:
+    rng = random.Random(0)
+
+    def name() -> str:
+        # Includes a combining acute accent, U+0301, which is in spotdl's
+        # BAD_CHARS and so stripped by clean().
+        words = [
+            "".join(rng.choices(string.ascii_letters, k=rng.randint(3, 9)))
+            for _ in range(rng.randint(1, 4))
+        ]
+        if rng.random() < 0.2:
+            words.append("e\u0301")
+        return " ".join(words)
+
+    album_pool = [(name(), name()) for _ in range(albums)]
+    playlist = []
+    for _ in range(songs):
+        album_name, artist = rng.choice(album_pool)
+        playlist.append(SimpleNamespace(
+            album_name=album_name,
+            artist=artist,
+            name=name(),
+            track_number=rng.randint(1, 20),
+        ))
+    return playlist
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        _clean.cache_clear()
+        album_dir_name.cache_clear()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--albums", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    playlist = synthetic_playlist(args.songs, args.albums)
+    assert previous_paths(playlist) == current_paths(playlist), \
+        "paths differ between the previous and current implementation"
+    names = [song.name for song in playlist]
+
+    cases = {
+        "clean, previous": lambda: [previous_clean(n) for n in names],
+        "clean, current": lambda: [clean(n) for n in names],
+        "paths, previous": lambda: previous_paths(playlist),
+        "paths, current": lambda: current_paths(playlist),
+    }
+    print(f"{args.songs} songs across {args.albums} albums, best of {args.repeat}")
+    for label, func in cases.items():
+        elapsed = measure(func, args.repeat)
+        print(f"{label:<16} {elapsed * 1000:9.2f} ms  "
+              f"{elapsed / args.songs * 1e6:7.2f} us/song")
+
+
+if __name__ == "__main__":
+    main()
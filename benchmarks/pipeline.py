@@ -0,0 +1,270 @@
+"""
+Measures the download pipeline end to end without live services. Spotify
+is replaced by a local fake API serving a synthetic catalog, and the audio
+provider by one that fetches generated WAV files from the same server, so
+only ffmpeg and tagging do real work.
+
+Reports songs per minute, latency per stage (metadata, search, fetch,
+ffmpeg, tagging) and peak RSS for album, artist and playlist workloads.
+Concurrency comes from the usual environment variables, which makes it easy
+to compare settings:
+
+    ALBUM_DOWNLOAD_CONCURRENCY=4 python -m benchmarks.pipeline \\
+        --workload artist --albums-per-artist 10 --json results.json
+
+Needs ffmpeg on the path. Everything is written to a temporary directory.
+Peak RSS is the process peak so far, run one workload per invocation to
+compare it across workloads.
+"""
+from benchmarks.fakes import FakeAudioProvider, FakeServer
+
+import os
+import json
+import time
+import argparse
+import resource
+import statistics
+import tempfile
+import threading
+from collections import defaultdict
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+STAGES = ("metadata", "search", "fetch", "ffmpeg", "tagging")
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def wrap_async(self, stage: str, func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        summary = {}
+        for stage in STAGES:
+            values = samples.get(stage, [])
+            if not values:
+                continue
+            summary[stage] = {
+                "count": len(values),
+                "total_s": sum(values),
+                "mean_ms": statistics.mean(values) * 1000,
+                "p50_ms": statistics.median(values) * 1000,
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+            }
+        return summary
+
+
+def configure_environment(root: Path):
+    """
+    Points every directory the app writes to into root. Has to run before
+    anything from app is imported.
+    """
+    for name in ("MUSIC_DIR", "HOST_MUSIC_DIR", "PLAYLISTS_DIR", "LOGS_DIR", "DATA_DIR"):
+        path = root.joinpath(name.lower())
+        path.mkdir(parents=True, exist_ok=True)
+        os.environ[name] = str(path)
+    os.environ.setdefault("SPOTIFY_ID", "benchmark")
+    os.environ.setdefault("SPOTIFY_SECRET", "benchmark")
+
+
+def instrument(server: FakeServer, timer: StageTimer, search_latency: float, rate_limited: bool):
+    import spotdl.download.downloader as spotdl_downloader
+    from spotdl.utils.config import get_temp_path
+    from app.http_client import spotify, spotify_session
+    from app.models import spotify_types
+
+    spotify.prefix = f"{server.base_url}/v1/"
+    spotify._auth = "benchmark"
+    spotify.auth_manager = None
+    if not rate_limited:
+        spotify_session.get_adapter("http://").limiter = None
+
+    for name in (
+        "get_album_metadata",
+        "get_artist_metadata",
+        "get_playlist_metadata",
+        "get_track_metadata",
+    ):
+        setattr(spotify_types, name, timer.wrap("metadata", getattr(spotify_types, name)))
+
+    def search(self, song) -> str:
+        time.sleep(search_latency)
+        return f"{server.base_url}/audio/{song.song_id}"
+
+    spotdl_downloader.Downloader.search = timer.wrap("search", search)
+    spotdl_downloader.Downloader.search_lyrics = lambda self, song: None
+
+    FakeAudioProvider.temp_folder = get_temp_path()
+    FakeAudioProvider.get_download_metadata = timer.wrap(
+        "fetch", FakeAudioProvider.get_download_metadata)
+    spotdl_downloader.AudioProvider = FakeAudioProvider
+
+    if hasattr(spotdl_downloader, "async_convert"):
+        spotdl_downloader.async_convert = timer.wrap_async(
+            "ffmpeg", spotdl_downloader.async_convert)
+    else:
+        spotdl_downloader.convert = timer.wrap("ffmpeg", spotdl_downloader.convert)
+    spotdl_downloader.embed_metadata = timer.wrap(
+        "tagging", spotdl_downloader.embed_metadata)
+
+
+def count_songs(music_dir: Path) -> int:
+    from app.library.tags import AUDIO_EXTENSIONS
+
+    return sum(
+        1 for path in music_dir.rglob("*") if path.suffix.lower() in AUDIO_EXTENSIONS
+    )
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux.
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def run_workload(name: str, url: str, server: FakeServer, timer: StageTimer) -> Dict[str, Any]:
+    from app.download import download
+    from app.cache import metadata_cache
+    from app.context import get_music_dir
+    from app.http_client import spotify
+
+    metadata_cache.clear()
+    spotify.cache.clear()
+    timer.reset()
+    songs_before = count_songs(get_music_dir())
+    requests_before = server.requests
+
+    start = time.perf_counter()
+    download(url, name)
+    elapsed = time.perf_counter() - start
+
+    songs = count_songs(get_music_dir()) - songs_before
+    return {
+        "workload": name,
+        "songs": songs,
+        "seconds": elapsed,
+        "songs_per_minute": songs / elapsed * 60 if elapsed else 0.0,
+        "fake_server_requests": server.requests - requests_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.summary(),
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    rss = result["peak_rss_mb"]
+    print(
+        f"\n{result['workload']}: {result['songs']} songs in {result['seconds']:.1f}s, "
+        f"{result['songs_per_minute']:.1f} songs/min, "
+        f"{result['fake_server_requests']} fake server requests, "
+        f"peak RSS {rss['self']:.1f} MB (children {rss['children']:.1f} MB)"
+    )
+    print(f"  {'stage':<10}{'count':>7}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage, stats in result["stages"].items():
+        print(
+            f"  {stage:<10}{stats['count']:>7}{stats['total_s']:>10.2f}"
+            f"{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workload", choices=("album", "artist", "playlist"), action="append",
+        help="Repeat to run several, defaults to all three")
+    parser.add_argument("--albums-per-artist", type=int, default=10)
+    parser.add_argument("--tracks-per-album", type=int, default=12)
+    parser.add_argument("--playlist-tracks", type=int, default=100)
+    parser.add_argument("--audio-seconds", type=float, default=30)
+    parser.add_argument("--api-latency", type=float, default=0.05,
+                        help="Seconds per fake Spotify API response")
+    parser.add_argument("--search-latency", type=float, default=0.3,
+                        help="Seconds per fake audio search")
+    parser.add_argument("--fetch-latency", type=float, default=0.2,
+                        help="Seconds before a fake audio download starts")
+    parser.add_argument("--no-rate-limit", action="store_true",
+                        help="Bypass the Spotify rate limiter")
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="pipeline-benchmark-"))
+    configure_environment(root)
+
+    server = FakeServer(
+        api_latency=args.api_latency,
+        fetch_latency=args.fetch_latency,
+        audio_seconds=args.audio_seconds,
+        albums_per_artist=args.albums_per_artist,
+        tracks_per_album=args.tracks_per_album,
+        playlist_tracks=args.playlist_tracks,
+    )
+    server.start()
+    timer = StageTimer()
+    instrument(server, timer, args.search_latency, not args.no_rate_limit)
+
+    from app.context import (
+        get_album_download_concurrency,
+        get_album_metadata_concurrency,
+        get_music_format,
+    )
+
+    catalog = server.catalog
+    artist_ids = list(catalog.artists)
+    urls = {
+        # Each workload gets its own artist so the library index of one
+        # doesn't turn the next into a no-op.
+        "album": f"https://open.spotify.com/album/{catalog.artist_albums[artist_ids[0]][0]}",
+        "artist": f"https://open.spotify.com/artist/{artist_ids[1]}",
+        "playlist": f"https://open.spotify.com/playlist/{next(iter(catalog.playlists))}",
+    }
+    print(
+        f"Format {get_music_format()}, album metadata concurrency "
+        f"{get_album_metadata_concurrency()}, album download concurrency "
+        f"{get_album_download_concurrency()}, output in {root}"
+    )
+
+    results = []
+    for workload in args.workload or list(urls):
+        result = run_workload(workload, urls[workload], server, timer)
+        print_result(result)
+        results.append(result)
+
+    server.stop()
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures /query/ latency under concurrent load against a running server,
+and the latency of /health while the queries are in flight. With the query
+path blocking the event loop, /health latency tracks the slowest query.
+
+    python -m benchmarks.query_latency --base-url http://localhost:8000 \\
+        --concurrency 16 --requests 64 \\
+        https://open.spotify.com/artist/... https://open.spotify.com/album/...
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import urlopen
+
+
+def timed_get(url: str, timeout: float) -> Optional[float]:
+    start = time.perf_counter()
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            response.read()
+    except HTTPError as e:
+        print(f"{e.code} {url}")
+        return None
+    except Exception as e:
+        print(f"error {url}: {e}")
+        return None
+    return time.perf_counter() - start
+
+
+def summarize(name: str, samples: List[Optional[float]]):
+    ok = sorted(s for s in samples if s is not None)
+    if not ok:
+        print(f"{name:<8} no successful requests out of {len(samples)}")
+        return
+    p95 = ok[min(len(ok) - 1, int(len(ok) * 0.95))]
+    print(
+        f"{name:<8} n={len(ok):<5} failed={len(samples) - len(ok):<4} "
+        f"p50={statistics.median(ok) * 1000:8.1f} ms  "
+        f"p95={p95 * 1000:8.1f} ms  max={ok[-1] * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    query_urls = [
+        f"{args.base_url}/query/?url={quote(args.urls[i % len(args.urls)])}"
+        for i in range(args.requests)
+    ]
+    health_samples: List[Optional[float]] = []
+    stop = threading.Event()
+
+    def probe_health():
+        while not stop.is_set():
+            health_samples.append(
+                timed_get(f"{args.base_url}/health", args.timeout))
+            time.sleep(0.1)
+
+    prober = threading.Thread(target=probe_health, daemon=True)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        query_samples = list(
+            pool.map(lambda url: timed_get(url, args.timeout), query_urls))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    print(f"{args.requests} queries, concurrency {args.concurrency}, "
+          f"{elapsed:.1f} s total")
+    summarize("query", query_samples)
+    summarize("health", health_samples)
+
+
+if __name__ == "__main__":
+    main()
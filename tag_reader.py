@@ -0,0 +1,88 @@
+"""
+Reads the tags the library index needs from audio files.
+
+Lives outside the app package because the library scanner reads tags in
+worker processes started from a fork server, which preloads this module.
+Importing anything from app would also set up logging, the Spotify client
+and the data directories in that server, so this only imports mutagen.
+"""
+from typing import NamedTuple, Optional
+from pathlib import Path
+
+import logging
+import mutagen
+
+
+logger = logging.getLogger("master")
+
+# spotdl stores the Spotify url of a song in the source webpage tag, under a
+# different key depending on the container.
+_SOURCE_URL_KEYS = ("woas", "WOAS", "----:spotdl:WOAS", "comment")
+
+# ID3, MP4 and Vorbis comment keys, in order of preference.
+_ALBUM_KEYS = ("TALB", "\xa9alb", "album")
+_ALBUM_ARTIST_KEYS = ("TPE2", "aART", "albumartist", "TPE1", "\xa9ART", "artist")
+
+
+class SongTags(NamedTuple):
+    url: Optional[str] = None
+    bitrate: Optional[int] = None
+    album: Optional[str] = None
+    album_artist: Optional[str] = None
+
+
+def read_song_tags(path: Path) -> SongTags:
+    """
+    Reads the Spotify url spotdl embedded into an audio file, the bitrate of
+    the audio in bits per second, and the album and album artist names.
+    Missing values are None.
+    """
+    try:
+        audio = mutagen.File(str(path))
+    except Exception as e:
+        logger.debug(f"Failed to read tags of {path}: {e}")
+        return SongTags()
+    if audio is None:
+        return SongTags()
+    bitrate = getattr(audio.info, "bitrate", None) or None
+    if audio.tags is None:
+        return SongTags(bitrate=bitrate)
+    return SongTags(
+        _source_url(audio),
+        bitrate,
+        _first_text(audio, _ALBUM_KEYS),
+        _first_text(audio, _ALBUM_ARTIST_KEYS),
+    )
+
+
+def _first_text(audio, keys) -> Optional[str]:
+    for key in keys:
+        try:
+            value = audio.tags.get(key)
+        except (KeyError, ValueError):
+            continue
+        # ID3 frames keep their values in text, the others are lists.
+        value = getattr(value, "text", value)
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        if value:
+            return str(value)
+    return None
+
+
+def _source_url(audio) -> Optional[str]:
+    if hasattr(audio.tags, "getall"):
+        for frame in audio.tags.getall("WOAS"):
+            return frame.url
+
+    for key in _SOURCE_URL_KEYS:
+        try:
+            values = audio.tags.get(key)
+        except (KeyError, ValueError):
+            continue
+        for value in values or []:
+            if isinstance(value, bytes):
+                value = value.decode("utf-8", "ignore")
+            if "open.spotify.com/track/" in str(value):
+                return str(value)
+    return None
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import importlib
+from pathlib import Path
+
+# Importing app sets up logging, the Spotify client and the data
+# directories, so every directory it writes to is pointed into a temporary
+# one before any test module imports it.
+_root = Path(tempfile.mkdtemp(prefix="jmm-tests-"))
+for _name in ("MUSIC_DIR", "HOST_MUSIC_DIR", "PLAYLISTS_DIR", "LOGS_DIR", "DATA_DIR"):
+    _path = _root.joinpath(_name.lower())
+    _path.mkdir(parents=True, exist_ok=True)
+    os.environ[_name] = str(_path)
+os.environ.setdefault("SPOTIFY_ID", "tests")
+os.environ.setdefault("SPOTIFY_SECRET", "tests")
+os.environ["LOG_ASYNC"] = "false"
+os.environ["LIBRARY_FORMAT_POLICY"] = "any"
+
+import pytest
+from spotdl.types.song import Song
+
+
+def make_song(song_id: str, album_id: str = "album", track_number: int = 1, tracks_count: int = 1) -> Song:
+    return Song(
+        name=f"Song {song_id}",
+        artists=["Artist"],
+        artist="Artist",
+        genres=[],
+        disc_number=1,
+        disc_count=1,
+        album_name=f"Album {album_id}",
+        album_artist="Artist",
+        duration=180,
+        year=2020,
+        date="2020-01-01",
+        track_number=track_number,
+        tracks_count=tracks_count,
+        song_id=song_id,
+        explicit=False,
+        publisher="",
+        url=f"https://open.spotify.com/track/{song_id}",
+        isrc="",
+        cover_url="",
+        copyright_text="",
+        album_id=album_id,
+    )
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """
+    An empty library index in its own database, installed wherever the
+    download code looks it up.
+    """
+    from app.library import index
+
+    library_index = index.LibraryIndex(db_name=f"library-{tmp_path.name}")
+    monkeypatch.setattr(download_module(), "library_index", library_index)
+    return library_index
+
+
+def download_module():
+    # app.download re-exports a download function under the module's name.
+    return importlib.import_module("app.download.download")
+
+
+def add_song_file(library, song: Song, directory: Path) -> Path:
+    """
+    Writes a placeholder audio file for song and records it in library.
+    """
+    from app.library.index import FileEntry
+
+    path = directory.joinpath(f"{song.song_id}.mp3")
+    path.write_bytes(b"")
+    library.record(FileEntry(song.song_id, song.album_id, path))
+    return path
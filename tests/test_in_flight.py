@@ -0,0 +1,72 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from spotdl.download.progress_handler import SongTracker
+
+from app.download.in_flight import in_flight_albums
+from app.download.progress_tracker import ProgressTracker
+from app.models.spotify_types import Album
+from conftest import add_song_file, download_module, make_song
+
+download = download_module()
+
+
+def song_tracker(song) -> SongTracker:
+    tracker = SongTracker.__new__(SongTracker)
+    tracker.song = song
+    tracker.song_name = song.display_name
+    return tracker
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_overlapping_album_downloads_share_progress(library, tmp_path, monkeypatch):
+    songs = [make_song(f"song{i}", track_number=i + 1, tracks_count=4) for i in range(4)]
+    album = Album(name="Album", url="", urls=[], songs=songs, artist={})
+    # One song is in the library already, so three are downloaded.
+    add_song_file(library, songs[0], tmp_path)
+    monkeypatch.setattr(download.cover_art, "prefetch", lambda urls: None)
+    monkeypatch.setattr(download.cover_art, "copy_to", lambda url, destination: False)
+
+    owner = ProgressTracker("overlap-owner", total_albums=1)
+    follower = ProgressTracker("overlap-follower", total_albums=1)
+    downloads = []
+    progress_on_attach = []
+
+    class Downloader:
+        def __init__(self, update_callback):
+            self.update_callback = update_callback
+
+        def download_multiple_songs(self, missing_songs):
+            downloads.append([song.song_id for song in missing_songs])
+            self.update_callback(song_tracker(missing_songs[0]), "Done")
+            # The follower attaches halfway through the album.
+            follower_thread.start()
+            wait_for(lambda: len(in_flight_albums.albums["album"].trackers) == 2)
+            progress_on_attach.append((owner.progress, follower.progress))
+            for song in missing_songs[1:]:
+                self.update_callback(song_tracker(song), "Done")
+            return [(song, None) for song in missing_songs]
+
+    @contextmanager
+    def acquire(output, save_file, update_callback, cancelled=None):
+        yield Downloader(update_callback)
+
+    monkeypatch.setattr(download.downloader_pool, "acquire", acquire)
+
+    follower_thread = threading.Thread(
+        target=lambda: download.download_album(album, follower))
+    with owner, follower:
+        download.download_album(album, owner)
+        follower_thread.join(timeout=5)
+
+        assert downloads == [["song1", "song2", "song3"]]
+        assert progress_on_attach == [(50.0, 50.0)]
+        assert owner.progress == 100.0
+        assert follower.progress == 100.0
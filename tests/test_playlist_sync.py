@@ -0,0 +1,63 @@
+import pytest
+
+from app.download.playlist_sync import PlaylistSyncStore
+from conftest import add_song_file, download_module, make_song
+
+download = download_module()
+
+URL = "https://open.spotify.com/playlist/playlist"
+
+
+@pytest.fixture
+def playlist(library, tmp_path, monkeypatch):
+    """
+    A playlist of four songs, all in the library and synced at "snapshot",
+    which is still its current snapshot. Returns the songs, their files and
+    the ids of the songs download_playlist was asked for.
+    """
+    songs = [make_song(f"song{i}", album_id=f"album{i}") for i in range(4)]
+    paths = {song.song_id: add_song_file(library, song, tmp_path) for song in songs}
+
+    store = PlaylistSyncStore(db_name=f"playlists-{tmp_path.name}")
+    store.save(URL, "snapshot", "Playlist", "", [song.song_id for song in songs])
+    monkeypatch.setattr(download, "playlist_sync_store", store)
+
+    metadata = {"name": "Playlist", "cover_url": ""}
+    monkeypatch.setattr(
+        download.Playlist, "get_snapshot_id", staticmethod(lambda url: "snapshot"))
+    monkeypatch.setattr(
+        download.Playlist,
+        "get_metadata",
+        staticmethod(lambda url: (metadata, songs, {song.song_id for song in songs})),
+    )
+
+    downloaded = []
+
+    def download_playlist(playlist_metadata, all_songs, new_songs):
+        for song in new_songs:
+            downloaded.append(song.song_id)
+            add_song_file(library, song, tmp_path)
+
+    monkeypatch.setattr(download, "download_playlist", download_playlist)
+    return songs, paths, store, downloaded
+
+
+def test_unchanged_playlist_is_skipped(playlist):
+    songs, paths, store, downloaded = playlist
+
+    download.download_playlist_from_url(URL)
+
+    assert downloaded == []
+
+
+def test_unchanged_playlist_downloads_gone_songs(playlist):
+    songs, paths, store, downloaded = playlist
+    paths["song1"].unlink()
+    paths["song3"].unlink()
+
+    download.download_playlist_from_url(URL)
+
+    assert sorted(downloaded) == ["song1", "song3"]
+    sync = store.get(URL)
+    assert sync["snapshot_id"] == "snapshot"
+    assert sync["track_ids"] == {song.song_id for song in songs}